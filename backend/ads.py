@@ -0,0 +1,183 @@
+"""
+In-process index of live advertisements, for serving ad slots without a
+database round trip.
+
+The index holds every active ad grouped by placement.location. It reloads
+(one find over the small advertisements collection) when the
+"advertisements" version counter moves, which every admin ad write bumps,
+so all workers converge within one poll interval.
+
+Within a slot, ads are drawn by weight with Walker's alias method: O(n)
+to build a table when the slot's live set changes, O(1) per draw. Ads
+may carry a starts_at / ends_at window (naive UTC ISO strings, like
+created_at); a slot's table is rebuilt lazily when the clock crosses the
+next window boundary.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from serialization import NO_ID
+
+logger = logging.getLogger(__name__)
+
+class AliasTable:
+    """Walker / Vose alias table: O(1) weighted draws from a fixed distribution"""
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.probability = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left over is 1 up to float rounding
+
+    def __len__(self) -> int:
+        return len(self.probability)
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.probability))
+        return i if rng.random() < self.probability[i] else self.alias[i]
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+class Slot:
+    """The active ads of one placement, and the alias table of those live now"""
+
+    def __init__(self, ads: List[Dict[str, Any]]):
+        self.ads = [
+            (ad, _parse_time(ad.get("starts_at")), _parse_time(ad.get("ends_at")))
+            for ad in ads
+            if (ad.get("weight") or 1) > 0
+        ]
+        self.live: List[Dict[str, Any]] = []
+        self.table: Optional[AliasTable] = None
+        # The live set is valid until this moment (the next start or end)
+        self.valid_until: Optional[datetime] = None
+        self.valid_from: Optional[datetime] = None
+
+    def _rebuild(self, now: datetime):
+        live = []
+        boundaries = []
+        for ad, starts_at, ends_at in self.ads:
+            if starts_at is not None and starts_at > now:
+                boundaries.append(starts_at)
+            elif ends_at is not None and ends_at <= now:
+                continue
+            else:
+                live.append(ad)
+                if ends_at is not None:
+                    boundaries.append(ends_at)
+        self.live = live
+        self.table = AliasTable([ad.get("weight") or 1 for ad in live]) if live else None
+        self.valid_from = now
+        self.valid_until = min(boundaries) if boundaries else None
+
+    def current(self, now: datetime) -> List[Dict[str, Any]]:
+        if self.valid_from is None or now < self.valid_from or (self.valid_until is not None and now >= self.valid_until):
+            self._rebuild(now)
+        return self.live
+
+    def pick(self, count: int, now: datetime, rng: random.Random) -> List[Dict[str, Any]]:
+        """Up to `count` distinct ads, drawn by weight"""
+        live = self.current(now)
+        if count >= len(live):
+            # Everything is shown; order it by a weighted shuffle
+            return sorted(live, key=lambda ad: rng.random() ** (1 / (ad.get("weight") or 1)), reverse=True)
+        chosen: List[int] = []
+        # Rejection of repeats stays cheap while count is small next to the slot
+        for _ in range(count * 8):
+            i = self.table.sample(rng)
+            if i not in chosen:
+                chosen.append(i)
+                if len(chosen) == count:
+                    break
+        else:
+            chosen += [i for i in range(len(live)) if i not in chosen][:count - len(chosen)]
+        return [live[i] for i in chosen]
+
+class AdIndex:
+    def __init__(self, collection, versions, refresh_interval: float = 1):
+        self.collection = collection
+        self.versions = versions
+        self.refresh_interval = refresh_interval
+        self.version: Optional[int] = None
+        self.loaded_at: Optional[datetime] = None
+        self.reloads = 0
+        self._slots: Dict[str, Slot] = {}
+        self._ids: set = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._rng = random.Random()
+
+    async def refresh(self, force: bool = False):
+        """Reload the index if the advertisements version moved (or when forced)"""
+        async with self._lock:
+            version = await self.versions.get("advertisements")
+            if not force and version == self.version:
+                return
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            async for ad in self.collection.find({"is_active": True}, NO_ID):
+                grouped.setdefault(ad["placement"]["location"], []).append(ad)
+            self._slots = {location: Slot(ads) for location, ads in grouped.items()}
+            self._ids = {ad["id"] for ads in grouped.values() for ad in ads}
+            self.version = version
+            self.loaded_at = datetime.utcnow()
+            self.reloads += 1
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Could not refresh the ad index: %s", e)
+
+    async def start(self):
+        await self.refresh(force=True)
+        self._task = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def __contains__(self, ad_id: str) -> bool:
+        """Whether an ad is active (as of the last reload)"""
+        return ad_id in self._ids
+
+    async def pick(self, location: str, count: int) -> List[Dict[str, Any]]:
+        if self.version is None:
+            await self.refresh()
+        slot = self._slots.get(location)
+        if slot is None:
+            return []
+        return slot.pick(count, datetime.utcnow(), self._rng)
+
+    def stats(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reloads": self.reloads,
+            "slots": {
+                location: {"active": len(slot.ads), "live": len(slot.current(now))}
+                for location, slot in self._slots.items()
+            },
+        }
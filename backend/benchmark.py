@@ -0,0 +1,749 @@
+"""
+Load and latency benchmarks for the travel offers backend.
+
+Usage (from the backend directory):
+    python benchmark.py seed --offers 100000
+    python benchmark.py run --base-url http://localhost:8001
+    python benchmark.py run --in-process --offers 1000
+    python benchmark.py compare bench_results/a.json bench_results/b.json
+
+`seed` writes a synthetic catalog (offers, categories, ads) generated from
+a fixed random seed, so the same --offers/--seed always produce the same
+documents. `run` drives every public and admin endpoint with concurrent
+clients, a fixed number of requests per scenario, and saves throughput and
+p50/p95/p99 latency to a JSON report tagged with the git commit.
+`compare` diffs two reports and exits non-zero on regressions.
+
+Targets:
+  --base-url      a running server (uvicorn, or nginx in front of it)
+  --in-process    the app in this process over ASGI, against MONGO_URL/DB_NAME
+  --in-memory     like --in-process, with mongomock-motor standing in for
+                  mongod (if installed). Useful to exercise the suite; its
+                  numbers aren't comparable with real mongod runs.
+
+Admin scenarios log in as the default admin (created if missing) and write
+offers, categories and (inactive) ads tagged "bench-" that they delete
+again. Login attempts are throttled per IP, so the login scenario is capped
+at a few requests. The live events stream (GET /api/events) never ends, and
+in-process transports buffer whole responses, so that scenario runs against
+--base-url only.
+"""
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import typer
+
+cli = typer.Typer(help="Load and latency benchmarks for the travel offers backend")
+
+DEFAULT_SEED = 42
+SEED_BATCH_SIZE = 5000
+REPORT_VERSION = 1
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin123"
+# Logins are throttled per IP (LOGIN_MAX_ATTEMPTS_PER_IP)
+LOGIN_REQUESTS = 10
+# Items per bulk create / update / delete request
+BULK_ITEMS = 50
+# Seconds an in-process app gets to migrate and start (like the entrypoint's READY_TIMEOUT)
+STARTUP_TIMEOUT = 120
+# Placement of the ads the admin scenarios create; no page shows it
+BENCH_AD_LOCATION = "bench"
+# 1x1 PNG for the upload scenario
+BENCH_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+DESTINATIONS = [
+    "Male", "Maafushi", "Baa Atoll", "Ari Atoll", "Addu City", "Fuvahmulah",
+    "Thoddoo", "Dhigurah", "Hulhumale", "Rasdhoo", "Ukulhas", "Fulidhoo",
+]
+CATEGORIES = ["Beach", "Diving", "Honeymoon", "Family", "Luxury", "Budget", "Adventure", "Wellness"]
+VOCABULARY = [
+    "overwater", "villa", "sunset", "snorkeling", "reef", "manta", "whale shark", "sandbank",
+    "spa", "seaplane", "speedboat", "lagoon", "all inclusive", "dolphin", "cruise", "island",
+    "surf", "yoga", "private pool", "turtle", "night fishing", "kayak", "paddleboard", "dinner",
+]
+AD_LOCATIONS = ["hero", "offer_detail"]
+
+# --- synthetic catalog ---
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+def generate_offer(rng: random.Random, index: int, base_time: datetime) -> Dict[str, Any]:
+    """One synthetic offer; deterministic for a given rng state"""
+    destination = rng.choice(DESTINATIONS)
+    created = base_time - timedelta(seconds=rng.randrange(365 * 86400))
+    start = created + timedelta(days=rng.randrange(7, 240))
+    return {
+        "id": _uuid(rng),
+        "title": f"{_phrase(rng, 2).title()} in {destination} #{index}",
+        "destination": destination,
+        "description": _phrase(rng, 40),
+        "price": round(rng.lognormvariate(7, 0.6), 2),
+        "travel_dates": {
+            "start_date": start.date().isoformat(),
+            "end_date": (start + timedelta(days=rng.randrange(3, 15))).date().isoformat(),
+        },
+        "company_name": f"Operator {rng.randrange(200)}",
+        "company_website": "https://example.com",
+        "category": rng.choice(CATEGORIES),
+        "images": [f"https://picsum.photos/seed/{index}/800/600"],
+        "contact_info": {"phone": "+960 000 0000", "email": "info@example.com", "address": destination},
+        "highlights": [_phrase(rng, 3) for _ in range(3)],
+        "inclusions": ["Breakfast", "Transfers"],
+        "exclusions": ["Flights"],
+        "itinerary": _phrase(rng, 20),
+        "created_at": created.isoformat(),
+        "updated_at": created.isoformat(),
+        "view_count": 0,
+        "popularity": 0,
+    }
+
+def generate_ads(rng: random.Random, base_time: datetime) -> List[Dict[str, Any]]:
+    ads = []
+    for location in AD_LOCATIONS:
+        for n in range(4):
+            ads.append({
+                "id": _uuid(rng),
+                "title": f"{location} ad {n}",
+                "description": _phrase(rng, 8),
+                "image_url": f"https://picsum.photos/seed/ad-{location}-{n}/1200/400",
+                "link_url": "https://example.com",
+                "placement": {"location": location},
+                "is_active": True,
+                "weight": rng.choice([1, 2, 5]),
+                "created_at": base_time.isoformat(),
+                "updated_at": base_time.isoformat(),
+            })
+    return ads
+
+async def seed_catalog(db, offers: int, seed: int = DEFAULT_SEED, drop: bool = True) -> Dict[str, int]:
+    """Write `offers` synthetic offers plus categories and ads to a Motor database"""
+    from category_stats import CategoryStats
+
+    rng = random.Random(seed)
+    # Fixed reference time, so created_at values don't depend on when the seed ran
+    base_time = datetime(2025, 1, 1)
+    if drop:
+        for name in ("travel_offers", "categories", "advertisements", "category_stats", "ad_stats"):
+            await db[name].delete_many({})
+
+    batch = []
+    for index in range(offers):
+        batch.append(generate_offer(rng, index, base_time))
+        if len(batch) >= SEED_BATCH_SIZE:
+            await db.travel_offers.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.travel_offers.insert_many(batch, ordered=False)
+
+    await db.categories.insert_many([
+        {"id": _uuid(rng), "name": name, "description": None, "created_at": base_time.isoformat()}
+        for name in CATEGORIES
+    ])
+    ads = generate_ads(rng, base_time)
+    await db.advertisements.insert_many(ads)
+
+    categories = await CategoryStats(db.category_stats, db.travel_offers).rebuild()
+    # Running servers drop cached catalog views when these versions move
+    for name in ("travel_offers", "advertisements", "offer_popularity"):
+        await db.collection_versions.update_one({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+    return {"offers": offers, "categories": categories, "advertisements": len(ads)}
+
+# --- load driver ---
+
+@dataclass
+class Scenario:
+    name: str
+    # (client, rng, context) -> response
+    request: Callable
+    requests: int
+    concurrency: int
+    admin: bool = False
+    # (client, context) -> None, run untimed before the scenario
+    setup: Optional[Callable] = None
+    # Needs a real connection (--base-url); see the module docstring
+    streaming: bool = False
+
+@dataclass
+class ScenarioResult:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    elapsed: float = 0
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(result: ScenarioResult) -> Dict[str, Any]:
+    latencies = sorted(result.latencies)
+    count = len(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": count,
+        "errors": result.errors,
+        "statuses": dict(sorted(result.statuses.items())),
+        "elapsed_s": round(result.elapsed, 3),
+        "throughput_rps": round(count / result.elapsed, 2) if result.elapsed else 0,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "mean": ms(sum(latencies) / count) if count else 0,
+            "max": ms(latencies[-1]) if latencies else 0,
+        },
+    }
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, context: Dict[str, Any], seed: int) -> ScenarioResult:
+    result = ScenarioResult()
+    remaining = iter(range(scenario.requests))
+
+    async def worker(worker_id: int):
+        # One rng per worker keeps parameter choices reproducible under concurrency
+        rng = random.Random(f"{seed}:{scenario.name}:{worker_id}")
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client, rng, context)
+            except httpx.HTTPError:
+                result.errors += 1
+                continue
+            result.latencies.append(time.perf_counter() - start)
+            status = str(response.status_code)
+            result.statuses[status] = result.statuses.get(status, 0) + 1
+            if response.status_code >= 400:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(min(scenario.concurrency, scenario.requests))))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def build_scenarios(requests: int, concurrency: int) -> List[Scenario]:
+    """
+    Every endpoint; order matters (writes create what later writes update
+    and delete). Update and delete scenarios create their targets first,
+    untimed, so they never run against missing documents.
+    """
+    def offer_id(rng, context):
+        return rng.choice(context["offer_ids"])
+
+    def auth(context):
+        return {"Authorization": f"Bearer {context['token']}"}
+
+    def new_offer(rng, context):
+        offer = generate_offer(rng, rng.randrange(10 ** 9), datetime(2025, 1, 1))
+        for internal in ("id", "created_at", "updated_at", "view_count", "popularity"):
+            offer.pop(internal)
+        offer["title"] = "bench-" + offer["title"]
+        return offer
+
+    def new_category(rng, context):
+        return {"name": f"bench-{_uuid(rng)}", "description": _phrase(rng, 4)}
+
+    def new_ad(rng, context):
+        # Inactive and in a placement of its own, so public ad reads don't change
+        return {
+            "title": "bench-" + _phrase(rng, 2),
+            "description": _phrase(rng, 8),
+            "image_url": "https://picsum.photos/seed/bench/1200/400",
+            "link_url": "https://example.com",
+            "placement": {"location": BENCH_AD_LOCATION},
+            "is_active": False,
+        }
+
+    def created(response, pool, context):
+        if response.status_code == 200:
+            context[pool].append(response.json()["id"])
+        return response
+
+    def bulk_created(response, pool, context):
+        if response.status_code == 200:
+            context[pool].extend(r["id"] for r in response.json()["results"] if r["status"] == "created")
+        return response
+
+    def take(pool, context, count=1):
+        ids = context[pool][-count:]
+        del context[pool][-count:]
+        return ids
+
+    def ensure(pool, create, count):
+        """Setup: create documents until `pool` holds at least `count` ids"""
+        async def setup(client, context):
+            rng = random.Random(f"setup:{pool}")
+            while len(context[pool]) < count:
+                before = len(context[pool])
+                response = await create(client, rng, context)
+                if len(context[pool]) == before:
+                    raise RuntimeError(f"Could not create benchmark {pool}: HTTP {response.status_code}")
+        return setup
+
+    # Offers
+
+    async def create_offer(client, rng, context):
+        response = await client.post("/api/admin/offers", json=new_offer(rng, context), headers=auth(context))
+        return created(response, "created_ids", context)
+
+    async def update_offer(client, rng, context):
+        target = rng.choice(context["created_ids"])
+        body = {"price": round(rng.uniform(100, 5000), 2), "highlights": [_phrase(rng, 3)]}
+        return await client.put(f"/api/admin/offers/{target}", json=body, headers=auth(context))
+
+    async def delete_offer(client, rng, context):
+        target, = take("created_ids", context)
+        return await client.delete(f"/api/admin/offers/{target}", headers=auth(context))
+
+    async def bulk_create(client, rng, context):
+        items = [new_offer(rng, context) for _ in range(BULK_ITEMS)]
+        response = await client.post("/api/admin/offers/bulk", json={"items": items}, headers=auth(context))
+        return bulk_created(response, "created_ids", context)
+
+    async def bulk_update(client, rng, context):
+        targets = rng.sample(context["created_ids"], BULK_ITEMS)
+        items = [{"id": target, "price": round(rng.uniform(100, 5000), 2)} for target in targets]
+        return await client.put("/api/admin/offers/bulk", json={"items": items}, headers=auth(context))
+
+    async def bulk_delete(client, rng, context):
+        body = {"ids": take("created_ids", context, BULK_ITEMS)}
+        return await client.request("DELETE", "/api/admin/offers/bulk", json=body, headers=auth(context))
+
+    async def export(client, rng, context):
+        async with client.stream("GET", "/api/admin/offers/export", params={"gzip": "true"}, headers=auth(context)) as response:
+            async for _ in response.aiter_bytes():
+                pass
+        return response
+
+    async def import_offers(client, rng, context):
+        offers = []
+        for _ in range(BULK_ITEMS):
+            offer = generate_offer(rng, rng.randrange(10 ** 9), datetime(2025, 1, 1))
+            offer["title"] = "bench-" + offer["title"]
+            offers.append(offer)
+        body = b"".join(json.dumps(offer).encode("utf-8") + b"\n" for offer in offers)
+        response = await client.post(
+            "/api/admin/offers/import", content=body,
+            headers={**auth(context), "Content-Type": "application/x-ndjson"},
+        )
+        if response.status_code == 200:
+            context["created_ids"].extend(offer["id"] for offer in offers)
+        return response
+
+    async def upload(client, rng, context):
+        files = {"file": ("bench.png", BENCH_PNG, "image/png")}
+        return await client.post("/api/admin/upload", files=files, headers=auth(context))
+
+    # Categories
+
+    async def create_category(client, rng, context):
+        response = await client.post("/api/admin/categories", json=new_category(rng, context), headers=auth(context))
+        return created(response, "category_ids", context)
+
+    async def update_category(client, rng, context):
+        target = rng.choice(context["category_ids"])
+        return await client.put(
+            f"/api/admin/categories/{target}", json={"description": _phrase(rng, 4)}, headers=auth(context)
+        )
+
+    async def delete_category(client, rng, context):
+        target, = take("category_ids", context)
+        return await client.delete(f"/api/admin/categories/{target}", headers=auth(context))
+
+    async def bulk_create_categories(client, rng, context):
+        items = [new_category(rng, context) for _ in range(BULK_ITEMS)]
+        response = await client.post("/api/admin/categories/bulk", json={"items": items}, headers=auth(context))
+        return bulk_created(response, "category_ids", context)
+
+    async def bulk_update_categories(client, rng, context):
+        items = [{"id": target, "description": _phrase(rng, 4)} for target in rng.sample(context["category_ids"], BULK_ITEMS)]
+        return await client.put("/api/admin/categories/bulk", json={"items": items}, headers=auth(context))
+
+    async def bulk_delete_categories(client, rng, context):
+        body = {"ids": take("category_ids", context, BULK_ITEMS)}
+        return await client.request("DELETE", "/api/admin/categories/bulk", json=body, headers=auth(context))
+
+    # Advertisements
+
+    async def create_ad(client, rng, context):
+        response = await client.post("/api/admin/advertisements", json=new_ad(rng, context), headers=auth(context))
+        return created(response, "ad_created_ids", context)
+
+    async def update_ad(client, rng, context):
+        target = rng.choice(context["ad_created_ids"])
+        return await client.put(
+            f"/api/admin/advertisements/{target}", json={"description": _phrase(rng, 8)}, headers=auth(context)
+        )
+
+    async def delete_ad(client, rng, context):
+        target, = take("ad_created_ids", context)
+        return await client.delete(f"/api/admin/advertisements/{target}", headers=auth(context))
+
+    async def bulk_create_ads(client, rng, context):
+        items = [new_ad(rng, context) for _ in range(BULK_ITEMS)]
+        response = await client.post("/api/admin/advertisements/bulk", json={"items": items}, headers=auth(context))
+        return bulk_created(response, "ad_created_ids", context)
+
+    async def bulk_update_ads(client, rng, context):
+        items = [{"id": target, "description": _phrase(rng, 8)} for target in rng.sample(context["ad_created_ids"], BULK_ITEMS)]
+        return await client.put("/api/admin/advertisements/bulk", json={"items": items}, headers=auth(context))
+
+    async def bulk_delete_ads(client, rng, context):
+        body = {"ids": take("ad_created_ids", context, BULK_ITEMS)}
+        return await client.request("DELETE", "/api/admin/advertisements/bulk", json=body, headers=auth(context))
+
+    # Other
+
+    async def login(client, rng, context):
+        return await client.post("/api/admin/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+
+    async def events_connect(client, rng, context):
+        # Time to the first frame of the stream, then hang up
+        async with client.stream("GET", "/api/events") as response:
+            async for _ in response.aiter_bytes():
+                break
+        return response
+
+    def get(path: Callable[[random.Random, Dict[str, Any]], str], params=None, admin=False):
+        async def request(client, rng, context):
+            query = params(rng, context) if callable(params) else params
+            return await client.get(path(rng, context), params=query, headers=auth(context) if admin else None)
+        return request
+
+    def post(path: Callable[[random.Random, Dict[str, Any]], str], admin=False):
+        async def request(client, rng, context):
+            return await client.post(path(rng, context), headers=auth(context) if admin else None)
+        return request
+
+    n, c = requests, concurrency
+    # Few, slow or heavy requests get a smaller share
+    small = max(n // 20, 1)
+    bulk = max(small // 10, 1)
+    return [
+        Scenario("health_live", get(lambda r, x: "/api/health/live"), n, c),
+        Scenario("health_ready", get(lambda r, x: "/api/health/ready"), n, c),
+        Scenario("api_root", get(lambda r, x: "/api/"), small, c),
+        Scenario("metrics", get(lambda r, x: "/metrics"), small, c),
+        Scenario("offers_list_default", get(lambda r, x: "/api/offers"), n, c),
+        Scenario("offers_list_uncached_pages", get(
+            lambda r, x: "/api/offers", lambda r, x: {"min_price": r.randrange(100, 3000), "limit": 24}), n, c),
+        Scenario("offers_by_price", get(lambda r, x: "/api/offers", {"sort_by": "price", "sort_order": "asc"}), n, c),
+        Scenario("offers_by_popularity", get(lambda r, x: "/api/offers", {"sort_by": "popularity"}), n, c),
+        Scenario("offers_category", get(lambda r, x: "/api/offers", lambda r, x: {"category": r.choice(CATEGORIES)}), n, c),
+        Scenario("offers_search", get(lambda r, x: "/api/offers", lambda r, x: {"q": r.choice(VOCABULARY)}), n, c),
+        Scenario("offers_facets", get(
+            lambda r, x: "/api/offers", lambda r, x: {"facets": "true", "category": r.choice(CATEGORIES)}), n, c),
+        Scenario("offer_detail", get(lambda r, x: f"/api/offers/{offer_id(r, x)}"), n, c),
+        Scenario("categories", get(lambda r, x: "/api/categories"), n, c),
+        Scenario("ads_list", get(lambda r, x: "/api/advertisements", {"location": "hero"}), n, c),
+        Scenario("ads_pick", get(lambda r, x: "/api/advertisements", lambda r, x: {"location": r.choice(AD_LOCATIONS), "pick": 1}), n, c),
+        Scenario("ad_detail", get(lambda r, x: f"/api/advertisements/{r.choice(x['ad_ids'])}"), n, c),
+        Scenario("ad_impression", post(lambda r, x: f"/api/advertisements/{r.choice(x['ad_ids'])}/impression"), n, c),
+        Scenario("ad_click", post(lambda r, x: f"/api/advertisements/{r.choice(x['ad_ids'])}/click"), n, c),
+        Scenario("events_connect", events_connect, small, c, streaming=True),
+        Scenario("admin_create_default", post(lambda r, x: "/api/admin/create-default-admin"), small, c, admin=True),
+        Scenario("admin_login", login, min(LOGIN_REQUESTS, n), min(c, 2), admin=True),
+        Scenario("admin_categories", get(lambda r, x: "/api/admin/categories", admin=True), n, c, admin=True),
+        Scenario("admin_category_stats", get(lambda r, x: "/api/admin/categories/stats", admin=True), n, c, admin=True),
+        Scenario("admin_category_create", create_category, small, c, admin=True),
+        Scenario("admin_category_bulk_create", bulk_create_categories, bulk, min(c, 4), admin=True),
+        Scenario("admin_category_update", update_category, small, c, admin=True,
+                 setup=ensure("category_ids", create_category, 1)),
+        Scenario("admin_category_bulk_update", bulk_update_categories, bulk, min(c, 4), admin=True,
+                 setup=ensure("category_ids", bulk_create_categories, BULK_ITEMS)),
+        Scenario("admin_category_delete", delete_category, small, c, admin=True,
+                 setup=ensure("category_ids", bulk_create_categories, small + bulk * BULK_ITEMS)),
+        Scenario("admin_category_bulk_delete", bulk_delete_categories, bulk, min(c, 4), admin=True,
+                 setup=ensure("category_ids", bulk_create_categories, bulk * BULK_ITEMS)),
+        Scenario("admin_category_stats_rebuild", post(lambda r, x: "/api/admin/categories/stats/rebuild", admin=True),
+                 3, 1, admin=True),
+        Scenario("admin_offer_create", create_offer, small, c, admin=True),
+        Scenario("admin_offer_bulk_create", bulk_create, bulk, min(c, 4), admin=True),
+        Scenario("admin_offer_update", update_offer, small, c, admin=True,
+                 setup=ensure("created_ids", create_offer, 1)),
+        Scenario("admin_offer_bulk_update", bulk_update, bulk, min(c, 4), admin=True,
+                 setup=ensure("created_ids", bulk_create, BULK_ITEMS)),
+        Scenario("admin_offer_delete", delete_offer, small, c, admin=True,
+                 setup=ensure("created_ids", bulk_create, small + bulk * BULK_ITEMS)),
+        Scenario("admin_offer_bulk_delete", bulk_delete, bulk, min(c, 4), admin=True,
+                 setup=ensure("created_ids", bulk_create, bulk * BULK_ITEMS)),
+        Scenario("admin_export", export, 3, 1, admin=True),
+        Scenario("admin_import", import_offers, 3, 1, admin=True),
+        Scenario("admin_upload", upload, small, c, admin=True),
+        Scenario("admin_ad_create", create_ad, small, c, admin=True),
+        Scenario("admin_ad_bulk_create", bulk_create_ads, bulk, min(c, 4), admin=True),
+        Scenario("admin_ad_update", update_ad, small, c, admin=True,
+                 setup=ensure("ad_created_ids", create_ad, 1)),
+        Scenario("admin_ad_bulk_update", bulk_update_ads, bulk, min(c, 4), admin=True,
+                 setup=ensure("ad_created_ids", bulk_create_ads, BULK_ITEMS)),
+        Scenario("admin_ad_delete", delete_ad, small, c, admin=True,
+                 setup=ensure("ad_created_ids", bulk_create_ads, small + bulk * BULK_ITEMS)),
+        Scenario("admin_ad_bulk_delete", bulk_delete_ads, bulk, min(c, 4), admin=True,
+                 setup=ensure("ad_created_ids", bulk_create_ads, bulk * BULK_ITEMS)),
+        Scenario("admin_ad_stats", get(lambda r, x: "/api/admin/advertisements/stats", admin=True), small, c, admin=True),
+        Scenario("admin_login_stats", get(lambda r, x: "/api/admin/login/stats", admin=True), small, c, admin=True),
+        Scenario("admin_cache_stats", get(lambda r, x: "/api/admin/cache/stats", admin=True), small, c, admin=True),
+        Scenario("admin_snapshot_stats", get(lambda r, x: "/api/admin/snapshots/stats", admin=True), small, c, admin=True),
+        Scenario("admin_event_stats", get(lambda r, x: "/api/admin/events/stats", admin=True), small, c, admin=True),
+        Scenario("admin_ad_index_stats", get(lambda r, x: "/api/admin/ad-index/stats", admin=True), small, c, admin=True),
+    ]
+
+async def prepare_context(client: httpx.AsyncClient, sample: int, seed: int) -> Dict[str, Any]:
+    """Sample ids to request and log in as the benchmark admin"""
+    await client.post("/api/admin/create-default-admin")
+    response = await client.post("/api/admin/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+    response.raise_for_status()
+    token = response.json()["access_token"]
+
+    offer_ids = []
+    cursor = None
+    while len(offer_ids) < sample:
+        params = {"fields": "id", "limit": 500, "sort_by": "price"}
+        if cursor:
+            params["cursor"] = cursor
+        page = await client.get("/api/offers", params=params)
+        page.raise_for_status()
+        offer_ids.extend(offer["id"] for offer in page.json())
+        cursor = page.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    if not offer_ids:
+        raise typer.BadParameter("The target has no offers; run `benchmark.py seed` first")
+    random.Random(seed).shuffle(offer_ids)
+
+    ads = await client.get("/api/advertisements", params={"active_only": "true"})
+    ad_ids = [ad["id"] for ad in ads.json()]
+    if not ad_ids:
+        raise typer.BadParameter("The target has no active ads; run `benchmark.py seed` first")
+    return {
+        "token": token,
+        "offer_ids": offer_ids[:sample],
+        "ad_ids": ad_ids,
+        # Documents the admin scenarios created and haven't deleted yet
+        "created_ids": [],
+        "category_ids": [],
+        "ad_created_ids": [],
+    }
+
+async def run_suite(
+    client: httpx.AsyncClient, scenarios: List[Scenario], seed: int, warmup: int, only: Optional[List[str]],
+    streaming: bool = True,
+):
+    context = await prepare_context(client, sample=2000, seed=seed)
+    results = {}
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        if scenario.streaming and not streaming:
+            typer.echo(f"{scenario.name:28} skipped (needs --base-url)")
+            continue
+        if scenario.setup is not None:
+            await scenario.setup(client, context)
+        if warmup and not scenario.admin:
+            warm = Scenario(scenario.name, scenario.request, warmup, scenario.concurrency)
+            await run_scenario(client, warm, context, seed + 1)
+        result = await run_scenario(client, scenario, context, seed)
+        results[scenario.name] = summarize(result)
+        stats = results[scenario.name]
+        typer.echo(
+            f"{scenario.name:28} {stats['throughput_rps']:>9.1f} req/s  "
+            f"p50 {stats['latency_ms']['p50']:>8.2f} ms  p95 {stats['latency_ms']['p95']:>8.2f} ms  "
+            f"p99 {stats['latency_ms']['p99']:>8.2f} ms  errors {stats['errors']}"
+        )
+    # Remove what the write scenarios left behind
+    headers = {"Authorization": f"Bearer {context['token']}"}
+    for path, pool in (
+        ("/api/admin/offers/bulk", "created_ids"),
+        ("/api/admin/categories/bulk", "category_ids"),
+        ("/api/admin/advertisements/bulk", "ad_created_ids"),
+    ):
+        ids = context[pool]
+        for start in range(0, len(ids), 1000):
+            await client.request("DELETE", path, json={"ids": ids[start:start + 1000]}, headers=headers)
+    return results
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _environment() -> Dict[str, Any]:
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def _in_memory_client():
+    """Swap Motor for mongomock-motor before the server module creates its client"""
+    try:
+        import mongomock_motor
+    except ImportError:
+        raise typer.BadParameter("--in-memory needs mongomock-motor (pip install mongomock-motor)")
+    import motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+async def _run(
+    base_url: Optional[str], in_process: bool, in_memory: bool, offers: int, seed: int,
+    requests: int, concurrency: int, warmup: int, only: Optional[List[str]],
+) -> Dict[str, Any]:
+    scenarios = build_scenarios(requests, concurrency)
+    timeout = httpx.Timeout(60)
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+            return await run_suite(client, scenarios, seed, warmup, only)
+
+    if in_memory:
+        _in_memory_client()
+    # Let the benchmark's own logins through the per-IP throttle
+    os.environ.setdefault("LOGIN_MAX_ATTEMPTS_PER_IP", "1000")
+    os.environ.setdefault("EXPLAIN_CHECK_ON_STARTUP", "false")
+    import server
+
+    async with server.app.router.lifespan_context(server.app):
+        # Migrations run in the background; wait for them like the entrypoint does
+        try:
+            await asyncio.wait_for(server.app.state.startup, timeout=STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            # finish_startup retries failed steps forever; the log above says why
+            typer.echo(f"The app did not finish starting within {STARTUP_TIMEOUT}s; see the startup errors above", err=True)
+            raise typer.Exit(code=1)
+        if in_memory or offers:
+            await seed_catalog(server.db, offers or 1000, seed)
+            await server.ad_index.refresh(force=True)
+        # Server errors come back as 500 responses, as they would over the network
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            return await run_suite(client, scenarios, seed, warmup, only, streaming=False)
+
+@cli.command("seed")
+def seed_command(
+    offers: int = typer.Option(1000, help="Offers to generate (e.g. 1000, 100000, 1000000)"),
+    seed: int = typer.Option(DEFAULT_SEED, help="Random seed; the same seed gives the same catalog"),
+    mongo_url: str = typer.Option(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), help="mongod to write to"),
+    db_name: str = typer.Option(os.environ.get("DB_NAME", "travel_db"), help="Database to write to"),
+    drop: bool = typer.Option(True, help="Empty the catalog collections first"),
+):
+    """Write a synthetic, reproducible catalog to a local mongod"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def seed_db():
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            return await seed_catalog(client[db_name], offers, seed, drop)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    counts = asyncio.run(seed_db())
+    typer.echo(f"Seeded {counts} into {db_name} in {time.perf_counter() - started:.1f}s")
+
+@cli.command("run")
+def run_command(
+    base_url: Optional[str] = typer.Option(None, help="Benchmark a running server, e.g. http://localhost:8001"),
+    in_process: bool = typer.Option(False, help="Run the app in this process against MONGO_URL/DB_NAME"),
+    in_memory: bool = typer.Option(False, help="Run the app in this process on mongomock-motor"),
+    offers: int = typer.Option(0, help="Seed this many offers first (in-process targets only; 0 keeps the data)"),
+    seed: int = typer.Option(DEFAULT_SEED),
+    requests: int = typer.Option(2000, help="Requests per scenario"),
+    concurrency: int = typer.Option(32, help="Concurrent clients per scenario"),
+    warmup: int = typer.Option(100, help="Unrecorded requests before each read scenario"),
+    only: Optional[List[str]] = typer.Option(None, help="Run only these scenarios"),
+    output: Optional[Path] = typer.Option(None, help="Report path (default bench_results/<time>-<commit>.json)"),
+    label: str = typer.Option("", help="Free-form note stored in the report"),
+):
+    """Drive every endpoint with concurrent clients and save a latency report"""
+    if sum([bool(base_url), in_process, in_memory]) != 1:
+        raise typer.BadParameter("Choose exactly one of --base-url, --in-process and --in-memory")
+    if base_url and offers:
+        raise typer.BadParameter("--offers seeds in-process targets only; use `benchmark.py seed` for a server")
+
+    results = asyncio.run(_run(base_url, in_process, in_memory, offers, seed, requests, concurrency, warmup, only))
+    environment = _environment()
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "label": label,
+        "environment": environment,
+        "config": {
+            "target": base_url or ("in-memory" if in_memory else "in-process"),
+            "offers": offers or None,
+            "seed": seed,
+            "requests": requests,
+            "concurrency": concurrency,
+            "warmup": warmup,
+        },
+        "scenarios": results,
+    }
+    if output is None:
+        commit = (environment["commit"] or "nogit")[:10]
+        output = Path("bench_results") / f"{datetime.utcnow():%Y%m%dT%H%M%S}-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, sort_keys=True))
+    typer.echo(f"Report written to {output}")
+
+@cli.command("compare")
+def compare_command(
+    baseline: Path,
+    candidate: Path,
+    threshold: float = typer.Option(0.10, help="Relative slowdown counted as a regression"),
+    metric: List[str] = typer.Option(["p50", "p95", "p99"], help="Latency percentiles to compare"),
+):
+    """Compare two reports; exits with status 1 if any scenario regressed"""
+    base = json.loads(baseline.read_text())
+    cand = json.loads(candidate.read_text())
+    if base["config"] != cand["config"]:
+        typer.echo(f"warning: configs differ\n  baseline:  {base['config']}\n  candidate: {cand['config']}", err=True)
+
+    regressions = []
+    typer.echo(f"{'scenario':28} {'metric':>10} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name, before in sorted(base["scenarios"].items()):
+        after = cand["scenarios"].get(name)
+        if after is None:
+            typer.echo(f"{name:28} missing from candidate")
+            continue
+        rows = [(p, before["latency_ms"][p], after["latency_ms"][p], False) for p in metric]
+        rows.append(("rps", before["throughput_rps"], after["throughput_rps"], True))
+        for label, old, new, higher_is_better in rows:
+            change = (new - old) / old if old else 0.0
+            regressed = (-change if higher_is_better else change) > threshold
+            if regressed:
+                regressions.append(f"{name} {label}")
+            flag = "  REGRESSED" if regressed else ""
+            typer.echo(f"{name:28} {label:>10} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{flag}")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name} errors")
+            typer.echo(f"{name:28} {'errors':>10} {before['errors']:>10} {after['errors']:>10}  REGRESSED")
+
+    if regressions:
+        typer.echo(f"{len(regressions)} regression(s): {', '.join(regressions)}", err=True)
+        raise typer.Exit(code=1)
+    typer.echo("No regressions")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,232 @@
+"""
+Batch create / update / delete for the admin endpoints.
+
+Each item is validated on its own and the valid ones are written with a
+single insert_many / bulk_write / delete_many. The result lists one entry
+per input item, in input order, with status "created", "updated",
+"deleted", "error" or "skipped".
+
+ordered=True stops at the first failing item (later items are "skipped"),
+mirroring MongoDB's ordered bulk writes. ordered=False writes everything
+that can be written.
+"""
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Largest batch a single request may carry
+BULK_MAX_ITEMS = 10000
+
+class BulkRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., max_length=BULK_MAX_ITEMS)
+    ordered: bool = False
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=BULK_MAX_ITEMS)
+    ordered: bool = False
+
+class BulkResult:
+    def __init__(self, size: int, ordered: bool):
+        self.ordered = ordered
+        self.results: List[Optional[Dict[str, Any]]] = [None] * size
+
+    def ok(self, index: int, item_id: str, status: str):
+        self.results[index] = {"index": index, "id": item_id, "status": status}
+
+    def fail(self, index: int, error: str, item_id: Optional[str] = None):
+        self.results[index] = {"index": index, "id": item_id, "status": "error", "error": error}
+
+    def skip_rest(self):
+        for index, result in enumerate(self.results):
+            if result is None:
+                self.results[index] = {"index": index, "id": None, "status": "skipped"}
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.skip_rest()
+        failed = sum(1 for r in self.results if r["status"] == "error")
+        skipped = sum(1 for r in self.results if r["status"] == "skipped")
+        return {
+            "ordered": self.ordered,
+            "succeeded": len(self.results) - failed - skipped,
+            "failed": failed,
+            "skipped": skipped,
+            "results": self.results,
+        }
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'item'}: {err['msg']}"
+        for err in error.errors()
+    )
+
+def _write_error_message(write_error: Dict[str, Any]) -> str:
+    if write_error.get("code") == 11000:
+        return f"Duplicate key: {write_error.get('keyValue') or write_error.get('errmsg')}"
+    return write_error.get("errmsg", "Write failed")
+
+async def _parse(model: Type[BaseModel], data: Dict[str, Any], prepare) -> BaseModel:
+    obj = model(**data)
+    if prepare is not None:
+        obj = await prepare(obj)
+    return obj
+
+def _handle_write_errors(result: BulkResult, error: BulkWriteError, positions: List[int], ids: List[str]) -> set:
+    """Record per-item write errors; returns the write positions that failed or never ran"""
+    write_errors = error.details.get("writeErrors", [])
+    failed = set()
+    for write_error in write_errors:
+        op_index = write_error["index"]
+        result.fail(positions[op_index], _write_error_message(write_error), ids[op_index])
+        failed.add(op_index)
+    if result.ordered and write_errors:
+        # An ordered bulk write stops at its first error
+        first = min(failed)
+        failed.update(range(first, len(positions)))
+    return failed
+
+async def bulk_insert(
+    collection,
+    items: List[Dict[str, Any]],
+    create_model: Type[BaseModel],
+    document_model: Type[BaseModel],
+    ordered: bool,
+    prepare: Optional[Callable[[BaseModel], Awaitable[BaseModel]]] = None,
+) -> Tuple[BulkResult, List[Dict[str, Any]]]:
+    """Validate and insert items; returns the result and the documents written"""
+    result = BulkResult(len(items), ordered)
+    docs, positions = [], []
+    for index, item in enumerate(items):
+        try:
+            obj = await _parse(create_model, item, prepare)
+        except ValidationError as e:
+            result.fail(index, validation_message(e))
+        except HTTPException as e:
+            result.fail(index, str(e.detail))
+        else:
+            docs.append(document_model(**obj.dict()).dict())
+            positions.append(index)
+            continue
+        if ordered:
+            break
+
+    ids = [doc["id"] for doc in docs]
+    failed = set()
+    if docs:
+        try:
+            await collection.insert_many(docs, ordered=ordered)
+        except BulkWriteError as e:
+            failed = _handle_write_errors(result, e, positions, ids)
+
+    written = []
+    for op_index, doc in enumerate(docs):
+        if op_index in failed:
+            continue
+        doc.pop("_id", None)
+        result.ok(positions[op_index], doc["id"], "created")
+        written.append(doc)
+    return result, written
+
+async def bulk_update(
+    collection,
+    items: List[Dict[str, Any]],
+    update_model: Type[BaseModel],
+    ordered: bool,
+    prepare: Optional[Callable[[BaseModel], Awaitable[BaseModel]]] = None,
+    touch_updated_at: bool = True,
+) -> Tuple[BulkResult, List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
+    """
+    Apply partial updates, each item carrying the `id` of its target (at
+    most once per request; repeats fail as "Duplicate id"). Returns the
+    result and (previous document, applied changes) pairs.
+    """
+    result = BulkResult(len(items), ordered)
+    parsed = []
+    for index, item in enumerate(items):
+        item_id = item.get("id")
+        try:
+            if not isinstance(item_id, str) or not item_id:
+                raise HTTPException(status_code=400, detail="id is required")
+            obj = await _parse(update_model, {k: v for k, v in item.items() if k != "id"}, prepare)
+        except ValidationError as e:
+            result.fail(index, validation_message(e), item_id)
+        except HTTPException as e:
+            result.fail(index, str(e.detail), item_id if isinstance(item_id, str) else None)
+        else:
+            update_data = {k: v for k, v in obj.dict(exclude_unset=True).items() if v is not None}
+            if touch_updated_at:
+                update_data["updated_at"] = datetime.utcnow().isoformat()
+            parsed.append((index, item_id, update_data))
+            continue
+        if ordered:
+            break
+
+    existing = {}
+    if parsed:
+        cursor = collection.find({"id": {"$in": [item_id for _, item_id, _ in parsed]}}, {"_id": 0})
+        existing = {doc["id"]: doc async for doc in cursor}
+
+    ops, positions, ids, changes = [], [], [], []
+    seen = set()
+    for index, item_id, update_data in parsed:
+        if item_id not in existing or item_id in seen:
+            # A repeat would be paired with the same pre-write document as the first
+            result.fail(index, "Not found" if item_id not in existing else "Duplicate id", item_id)
+            if ordered:
+                break
+            continue
+        ops.append(UpdateOne({"id": item_id}, {"$set": update_data}))
+        seen.add(item_id)
+        positions.append(index)
+        ids.append(item_id)
+        changes.append((existing[item_id], update_data))
+
+    failed = set()
+    if ops:
+        try:
+            await collection.bulk_write(ops, ordered=ordered)
+        except BulkWriteError as e:
+            failed = _handle_write_errors(result, e, positions, ids)
+
+    applied = []
+    for op_index, change in enumerate(changes):
+        if op_index in failed:
+            continue
+        result.ok(positions[op_index], ids[op_index], "updated")
+        applied.append(change)
+    return result, applied
+
+async def bulk_delete(
+    collection,
+    ids: List[str],
+    ordered: bool,
+    blocked: Optional[Callable[[List[str]], Awaitable[Dict[str, str]]]] = None,
+) -> Tuple[BulkResult, List[Dict[str, Any]]]:
+    """
+    Delete documents by id. `blocked` may veto ids (returning id -> reason).
+    Returns the result and the deleted documents.
+    """
+    result = BulkResult(len(ids), ordered)
+    existing = {doc["id"]: doc async for doc in collection.find({"id": {"$in": ids}}, {"_id": 0})}
+    vetoed = await blocked(list(existing)) if blocked is not None and existing else {}
+
+    to_delete, deleted = [], []
+    for index, item_id in enumerate(ids):
+        if item_id in vetoed:
+            result.fail(index, vetoed[item_id], item_id)
+        elif item_id not in existing or item_id in to_delete:
+            result.fail(index, "Not found", item_id)
+        else:
+            to_delete.append(item_id)
+            deleted.append(existing[item_id])
+            result.ok(index, item_id, "deleted")
+            continue
+        if ordered:
+            break
+
+    if to_delete:
+        await collection.delete_many({"id": {"$in": to_delete}})
+    return result, deleted
@@ -0,0 +1,386 @@
+"""
+Read-through cache for public catalog queries.
+
+Two tiers:
+  * an in-process LRU with a short TTL (always on)
+  * an optional Redis tier shared by every worker (enabled by REDIS_URL)
+
+Entries are stored already encoded (headers + JSON body), so a hit costs
+neither a Mongo query nor serialization. Keys are grouped by namespace
+("offers", "offer", "categories", "ads") so writes can drop a single key
+or a whole namespace. With Redis, invalidations are also broadcast over
+pub/sub so the in-process tier of every worker is cleared too.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import orjson
+from pymongo import ReturnDocument
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Redis tier is optional
+    aioredis = None
+    RedisError = Exception
+
+logger = logging.getLogger(__name__)
+
+# (headers, body)
+CacheEntry = Tuple[Dict[str, str], bytes]
+
+_MAX_KEY_LENGTH = 200
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+class QueryCache:
+    """Two-tier read-through cache with namespace and per-key invalidation"""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 5,
+        redis_url: Optional[str] = None,
+        redis_ttl: float = 300,
+        prefix: str = "catalog",
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.redis_url = redis_url if aioredis is not None else None
+        self.redis_ttl = int(redis_ttl)
+        self._local = TTLCache(maxsize, ttl)
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        # Bumped on every invalidation so an in-flight load can't repopulate stale data
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Keys invalidated while a load for them was in flight
+        self._dropped_keys: set = set()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        # Optional callback(namespace, tier) where tier is "local", "redis" or "miss"
+        self.observer: Optional[Callable[[str, str], None]] = None
+
+        if redis_url and aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using the local cache only")
+
+    # --- keys ---
+
+    def key(self, namespace: str, **params) -> str:
+        """Normalize query parameters into a stable cache key"""
+        items = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        normalized = urlencode(items)
+        if len(normalized) > _MAX_KEY_LENGTH:
+            normalized = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{namespace}:{normalized}"
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _index_key(self, namespace: str) -> str:
+        return f"{self.prefix}:index:{namespace}"
+
+    @property
+    def _channel(self) -> str:
+        return f"{self.prefix}:invalidate"
+
+    # --- lifecycle ---
+
+    async def start(self):
+        if not self.enabled or not self.redis_url:
+            return
+        self._redis = aioredis.from_url(self.redis_url)
+        self._listener = asyncio.create_task(self._listen_for_invalidations())
+        logger.info("Catalog cache using Redis tier at %s", self.redis_url)
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen_for_invalidations(self):
+        """Drop local entries when another worker invalidates them"""
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    kind, _, target = message["data"].decode("utf-8").partition(" ")
+                    if kind == "ns":
+                        self._drop_local_namespace(target)
+                    elif kind == "key":
+                        self._drop_local_key(target)
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.warning("Cache invalidation listener lost Redis connection: %s", e)
+                await asyncio.sleep(1)
+
+    # --- reads ---
+
+    def _record(self, namespace: str, tier: str):
+        if tier == "local":
+            self.local_hits += 1
+        elif tier == "redis":
+            self.redis_hits += 1
+        else:
+            self.misses += 1
+        if self.observer is not None:
+            self.observer(namespace, tier)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[CacheEntry]]) -> CacheEntry:
+        """Return the cached entry for key, calling loader once on a miss"""
+        if not self.enabled:
+            return await loader()
+
+        namespace = key.split(":", 1)[0]
+        entry = self._local.get(key)
+        if entry is not None:
+            self._record(namespace, "local")
+            return entry
+
+        entry = await self._redis_get(key)
+        if entry is not None:
+            self._local.set(key, entry)
+            self._record(namespace, "redis")
+            return entry
+
+        # Coalesce concurrent misses for the same key into one load
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._record(namespace, "local")
+            return await asyncio.shield(pending)
+
+        self._record(namespace, "miss")
+        generation = self._generations.get(namespace, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Only waiters should see the error; don't warn about it being unretrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(entry)
+
+        if self._generations.get(namespace, 0) == generation and key not in self._dropped_keys:
+            self._local.set(key, entry)
+            await self._redis_set(namespace, key, entry)
+        self._dropped_keys.discard(key)
+        return entry
+
+    async def _redis_get(self, key: str) -> Optional[CacheEntry]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(self._redis_key(key))
+        except RedisError as e:
+            logger.warning("Cache read from Redis failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        header_json, _, body = raw.partition(b"\n")
+        return orjson.loads(header_json), body
+
+    async def _redis_set(self, namespace: str, key: str, entry: CacheEntry):
+        if self._redis is None:
+            return
+        headers, body = entry
+        raw = orjson.dumps(headers) + b"\n" + body
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._redis_key(key), raw, ex=self.redis_ttl)
+                pipe.sadd(self._index_key(namespace), key)
+                pipe.expire(self._index_key(namespace), self.redis_ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Cache write to Redis failed: %s", e)
+
+    # --- invalidation ---
+
+    def _drop_local_key(self, key: str):
+        self._local.delete(key)
+        if key in self._inflight:
+            self._dropped_keys.add(key)
+
+    def _drop_local_namespace(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self._local.delete_prefix(f"{namespace}:")
+
+    async def invalidate(self, key: str):
+        """Drop a single key from every tier"""
+        self._drop_local_key(key)
+        if self._redis is None:
+            return
+        try:
+            namespace = key.split(":", 1)[0]
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.delete(self._redis_key(key))
+                pipe.srem(self._index_key(namespace), key)
+                pipe.publish(self._channel, f"key {key}")
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Cache invalidation in Redis failed: %s", e)
+
+    async def invalidate_namespace(self, namespace: str):
+        """Drop every key of a namespace from every tier"""
+        self._drop_local_namespace(namespace)
+        if self._redis is None:
+            return
+        try:
+            index_key = self._index_key(namespace)
+            keys = await self._redis.smembers(index_key)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                if keys:
+                    pipe.delete(*(self._redis_key(k.decode("utf-8")) for k in keys))
+                pipe.delete(index_key)
+                pipe.publish(self._channel, f"ns {namespace}")
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Cache invalidation in Redis failed: %s", e)
+
+    # --- observability ---
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "redis": self._redis is not None,
+            "local_entries": len(self._local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+
+class VersionCounter:
+    """
+    Per-collection version numbers, bumped on every admin write.
+
+    Versions live in a small Mongo collection so all workers agree on them;
+    reads go through a short in-process TTL so checking an ETag costs at most
+    one _id lookup per collection per `ttl` seconds.
+    """
+
+    def __init__(self, collection, ttl: float = 1):
+        self._collection = collection
+        self._local = TTLCache(maxsize=64, ttl=ttl)
+
+    async def get(self, name: str) -> int:
+        version = self._local.get(name)
+        if version is None:
+            doc = await self._collection.find_one({"_id": name})
+            version = doc["version"] if doc else 0
+            self._local.set(name, version)
+        return version
+
+    async def bump(self, name: str) -> int:
+        doc = await self._collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._local.set(name, doc["version"])
+        return doc["version"]
+
+class PrincipalCache:
+    """
+    Verified admin principals keyed by (a hash of) their bearer token.
+
+    An entry lives for the shorter of `ttl` and the token's remaining
+    lifetime. Entries are tagged with the admin_users version they were
+    verified at and only served while that is still the current version, so
+    bumping it (on any admin account change) revokes them on every worker
+    within the version counter's TTL. revoke(username) also drops that
+    user's tokens here right away.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self._local = TTLCache(maxsize, ttl)
+        self._tokens_by_user: Dict[str, set] = {}
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str, version: int = 0) -> Optional[Dict[str, Any]]:
+        entry = self._local.get(self._key(token))
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def set(self, token: str, user: Dict[str, Any], expires_at: float, version: int = 0):
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return
+        key = self._key(token)
+        self._local.set(key, (version, user), ttl=min(self._local.ttl, remaining))
+        tokens = self._tokens_by_user.setdefault(user["username"], set())
+        # Forget tokens that have already aged out of the LRU
+        tokens.intersection_update(k for k in tokens if self._local.get(k) is not None)
+        tokens.add(key)
+
+    def revoke(self, username: str):
+        for key in self._tokens_by_user.pop(username, ()):
+            self._local.delete(key)
+
+    def clear(self):
+        self._local.clear()
+        self._tokens_by_user.clear()
@@ -0,0 +1,90 @@
+"""
+Materialized per-category summary of the offer catalog.
+
+category_stats holds one document per category in use:
+    {"name", "count", "min_price", "max_price", "updated_at"}
+The offer write handlers pass the documents they added and removed to
+apply(), which adjusts counts with $inc and widens the price bounds with
+$min / $max. Removing an offer can only narrow the bounds, so those are
+re-read from the category_price_id index (two single-key lookups).
+rebuild() recomputes everything with one aggregation to repair drift.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, DeleteMany, ReplaceOne
+
+class CategoryStats:
+    def __init__(self, collection, offers):
+        self.collection = collection
+        self.offers = offers
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("name", unique=True)
+
+    async def list(self) -> List[Dict[str, Any]]:
+        """Categories with at least one offer, by name"""
+        cursor = self.collection.find({"count": {"$gt": 0}}, {"_id": 0}).sort("name", ASCENDING)
+        return await cursor.to_list(length=None)
+
+    async def apply(self, added: Iterable[Dict[str, Any]] = (), removed: Iterable[Dict[str, Any]] = ()):
+        """Fold added / removed offer documents into the summary"""
+        counts: Dict[str, int] = defaultdict(int)
+        added_prices: Dict[str, List[float]] = defaultdict(list)
+        narrowed = set()
+        for offer in added:
+            counts[offer["category"]] += 1
+            added_prices[offer["category"]].append(offer["price"])
+        for offer in removed:
+            counts[offer["category"]] -= 1
+            narrowed.add(offer["category"])
+
+        now = datetime.utcnow().isoformat()
+        for name, delta in counts.items():
+            update: Dict[str, Any] = {"$inc": {"count": delta}, "$set": {"updated_at": now}}
+            prices = added_prices.get(name)
+            if prices:
+                update["$min"] = {"min_price": min(prices)}
+                update["$max"] = {"max_price": max(prices)}
+            await self.collection.update_one({"name": name}, update, upsert=True)
+
+        for name in narrowed:
+            await self._refresh_bounds(name)
+        if narrowed:
+            await self.collection.delete_many({"count": {"$lte": 0}})
+
+    async def _refresh_bounds(self, name: str):
+        cheapest = await self._price_at(name, ASCENDING)
+        if cheapest is None:
+            await self.collection.delete_one({"name": name})
+            return
+        dearest = await self._price_at(name, DESCENDING)
+        await self.collection.update_one(
+            {"name": name}, {"$set": {"min_price": cheapest, "max_price": dearest}}
+        )
+
+    async def _price_at(self, name: str, direction: int) -> Optional[float]:
+        cursor = self.offers.find({"category": name}, {"_id": 0, "price": 1})
+        docs = await cursor.sort("price", direction).limit(1).to_list(length=1)
+        return docs[0]["price"] if docs else None
+
+    async def rebuild(self) -> int:
+        """Recompute the summary from travel_offers; returns the number of categories"""
+        now = datetime.utcnow().isoformat()
+        pipeline = [
+            {"$group": {
+                "_id": "$category",
+                "count": {"$sum": 1},
+                "min_price": {"$min": "$price"},
+                "max_price": {"$max": "$price"},
+            }},
+        ]
+        ops, names = [], []
+        async for group in self.offers.aggregate(pipeline):
+            name = group.pop("_id")
+            names.append(name)
+            ops.append(ReplaceOne({"name": name}, {"name": name, **group, "updated_at": now}, upsert=True))
+        ops.append(DeleteMany({"name": {"$nin": names}}))
+        await self.collection.bulk_write(ops, ordered=False)
+        return len(names)
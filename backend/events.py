@@ -0,0 +1,293 @@
+"""
+Catalog change events for live clients (GET /api/events, Server-Sent Events).
+
+The admin write handlers publish small events such as
+    {"type": "offer.updated", "data": {<offer summary>}}
+for offer.* and ad.* created / updated / deleted. EventBus encodes each
+event once and fans it out to every connected client of this worker.
+
+Writes are handled by whichever worker got the request, so events are
+relayed between workers (and containers): through a Redis channel when
+REDIS_URL is set, otherwise through the catalog_events collection, which
+every worker polls every `poll_interval` seconds. Either way event ids
+come from one shared counter, so a client can resume on any worker.
+A relay event whose id is skipped (its publisher took the counter but
+hasn't inserted yet) is waited for up to `gap_timeout` seconds, so the
+relay delivers in id order. catalog_events documents expire through a
+TTL index (see migrations.py).
+
+Each client has a bounded queue. A client that falls behind (slow link,
+backgrounded tab) can't make the server buffer without limit: once its
+queue is full, what it hasn't read yet is dropped and replaced by a
+single "resync" event telling it to refetch its lists. A reconnecting
+client sends Last-Event-ID and is replayed the events it missed from a
+small in-memory buffer, or told to resync if they are gone.
+
+Streams never end on their own, so the server would wait out its whole
+graceful timeout for them; close_streams() ends every open one (clients
+reconnect to another worker) as soon as the worker is told to stop.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+import orjson
+from pymongo import ReturnDocument
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Redis relay is optional
+    aioredis = None
+    RedisError = Exception
+
+logger = logging.getLogger(__name__)
+
+RESYNC = "resync"
+
+# catalog_events document holding the last id handed out (events use integer ids)
+_COUNTER_ID = "seq"
+
+def encode_event(event_id: Optional[str], event_type: str, data: Any) -> bytes:
+    """One SSE frame; data is a single line of JSON"""
+    frame = f"event: {event_type}\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return frame.encode("utf-8") + b"data: " + orjson.dumps(data) + b"\n\n"
+
+class Subscription:
+    """One client's bounded queue of encoded frames"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.resyncs = 0
+        self.closed = False
+
+    def put(self, frame: bytes):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.resync()
+
+    def resync(self):
+        """Drop everything pending; the client refetches instead"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(encode_event(None, RESYNC, {}))
+        self.resyncs += 1
+
+    def close(self):
+        """Pending frames are dropped; get() returns None from now on"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+        self.closed = True
+
+    async def get(self) -> Optional[bytes]:
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+class EventBus:
+    def __init__(
+        self,
+        collection=None,
+        redis_url: Optional[str] = None,
+        queue_size: int = 256,
+        replay_size: int = 1024,
+        max_clients: int = 1000,
+        poll_interval: float = 0.5,
+        gap_timeout: float = 2,
+        prefix: str = "travel",
+    ):
+        self.collection = collection
+        self.redis_url = redis_url if aioredis is not None else None
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.prefix = prefix
+        # Relayed ids are shared by every worker; local ones only mean something to this process
+        if self.redis_url:
+            self.epoch = "r"
+        elif collection is not None:
+            self.epoch = "m"
+        else:
+            self.epoch = uuid.uuid4().hex[:8]
+        self.published = 0
+        self._seq = 0
+        self._replay: Deque[Tuple[int, bytes]] = deque(maxlen=replay_size)
+        self._subscribers: Set[Subscription] = set()
+        self.closing = False
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        # When the relay first saw the id after _seq missing
+        self._gap_since: Optional[float] = None
+
+        if redis_url and aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed; events stay within each worker")
+
+    @property
+    def _channel(self) -> str:
+        return f"{self.prefix}:events"
+
+    @property
+    def _counter_key(self) -> str:
+        return f"{self.prefix}:events:seq"
+
+    # --- lifecycle ---
+
+    async def start(self):
+        if self.redis_url:
+            self._redis = aioredis.from_url(self.redis_url)
+            self._listener = asyncio.create_task(self._listen())
+        elif self.collection is not None:
+            # Only events published from now on are relayed to this worker
+            counter = await self.collection.find_one({"_id": _COUNTER_ID})
+            self._seq = counter["value"] if counter else 0
+            self._listener = asyncio.create_task(self._poll())
+
+    def close_streams(self):
+        """End every open stream and refuse new ones; the worker is going away"""
+        self.closing = True
+        for subscription in self._subscribers:
+            subscription.close()
+
+    async def close(self):
+        self.close_streams()
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    seq, _, frame = message["data"].partition(b" ")
+                    self._deliver(int(seq), frame)
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.warning("Event listener lost Redis connection: %s", e)
+                await asyncio.sleep(1)
+
+    async def _poll(self):
+        while True:
+            try:
+                await self._relay_from_collection()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Could not read relayed events: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _relay_from_collection(self):
+        cursor = self.collection.find({"_id": {"$gt": self._seq}}).sort("_id", 1).limit(1000)
+        async for doc in cursor:
+            if doc["_id"] != self._seq + 1:
+                # An earlier id may still be on its way; give it a moment, then move on
+                now = time.monotonic()
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.gap_timeout:
+                    return
+            self._gap_since = None
+            self._deliver(doc["_id"], bytes(doc["frame"]))
+
+    # --- publishing ---
+
+    async def publish(self, event_type: str, data: Any):
+        self.published += 1
+        if self._redis is not None:
+            try:
+                seq = await self._redis.incr(self._counter_key)
+                frame = encode_event(f"{self.epoch}-{seq}", event_type, data)
+                # Delivered to this worker's clients by _listen, like everyone else's
+                await self._redis.publish(self._channel, str(seq).encode("ascii") + b" " + frame)
+                return
+            except RedisError as e:
+                logger.warning("Could not publish event through Redis: %s", e)
+        elif self.collection is not None:
+            try:
+                counter = await self.collection.find_one_and_update(
+                    {"_id": _COUNTER_ID},
+                    {"$inc": {"value": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                seq = counter["value"]
+                frame = encode_event(f"{self.epoch}-{seq}", event_type, data)
+                # Delivered to this worker's clients by _poll, like everyone else's
+                await self.collection.insert_one({"_id": seq, "frame": frame, "at": datetime.utcnow()})
+                return
+            except Exception as e:
+                logger.warning("Could not relay event through Mongo: %s", e)
+        if self._redis is not None or self.collection is not None:
+            # Relay is down: this worker's clients still hear of it, without an id
+            # that would collide with the shared counter
+            self._broadcast(encode_event(None, event_type, data))
+            return
+        self._seq += 1
+        self._deliver(self._seq, encode_event(f"{self.epoch}-{self._seq}", event_type, data))
+
+    def _deliver(self, seq: int, frame: bytes):
+        self._seq = max(self._seq, seq)
+        self._replay.append((seq, frame))
+        self._broadcast(frame)
+
+    def _broadcast(self, frame: bytes):
+        for subscription in self._subscribers:
+            subscription.put(frame)
+
+    # --- clients ---
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscription]:
+        """A queue for one client, or None when this worker has no room or is stopping"""
+        if self.closing or len(self._subscribers) >= self.max_clients:
+            return None
+        subscription = Subscription(self.queue_size)
+        if last_event_id:
+            self._replay_to(subscription, last_event_id)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def _replay_to(self, subscription: Subscription, last_event_id: str):
+        epoch, _, seq = last_event_id.partition("-")
+        try:
+            last = int(seq)
+        except ValueError:
+            last = None
+        oldest = self._replay[0][0] if self._replay else self._seq + 1
+        if epoch != self.epoch or last is None or last > self._seq or last < oldest - 1:
+            # From another process, or older than the buffer
+            subscription.resync()
+            return
+        for event_seq, frame in self._replay:
+            if event_seq > last:
+                subscription.put(frame)
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._subscribers),
+            "published": self.published,
+            "last_event_id": f"{self.epoch}-{self._seq}",
+            "replay_buffer": len(self._replay),
+            "resyncs": sum(subscription.resyncs for subscription in self._subscribers),
+            "relay": "redis" if self._redis is not None else "mongo" if self.collection is not None else "local",
+        }
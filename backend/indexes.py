@@ -0,0 +1,95 @@
+"""
+Index definitions for the offer catalog and a startup check that the
+canonical list queries actually use them.
+
+Every sortable field has an index ending in `id`, because list queries
+sort on (field, id) for keyset pagination. Filtered shapes follow the
+equality / sort / range ordering, so one index serves both the filter
+and the sort.
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields GET /api/offers may sort on (besides text relevance)
+SORTABLE_FIELDS = ("created_at", "price", "travel_dates.start_date", "popularity")
+
+# (keys, options) for travel_offers compound indexes. They are built by a
+# migration (migrations.py): adding one here needs a new migration step too.
+OFFER_INDEXES: List[Tuple[List[Tuple[str, int]], Dict[str, Any]]] = [
+    # Unfiltered pages in each sort order; the trailing price key lets a
+    # price range be checked in the index while walking newest first
+    ([("created_at", -1), ("id", -1), ("price", 1)], {"name": "created_at_id_price"}),
+    ([("price", 1), ("id", 1)], {"name": "price_id"}),
+    ([("travel_dates.start_date", 1), ("id", 1)], {"name": "start_date_id"}),
+    # Decayed view score, most popular first
+    ([("popularity", -1), ("id", -1)], {"name": "popularity_id"}),
+    # Category filter, by price or newest first
+    ([("category", 1), ("price", 1), ("id", 1)], {"name": "category_price_id"}),
+    ([("category", 1), ("created_at", -1), ("id", -1)], {"name": "category_created_at_id"}),
+    # Destination filter, newest first
+    ([("destination", 1), ("created_at", -1), ("id", -1)], {"name": "destination_created_at_id"}),
+]
+
+# (description, filter, sort) of the query shapes the public pages issue
+CANONICAL_QUERIES = [
+    ("home page", {}, [("created_at", -1), ("id", -1)]),
+    ("by price", {}, [("price", 1), ("id", 1)]),
+    ("by travel date", {}, [("travel_dates.start_date", 1), ("id", 1)]),
+    ("most popular", {}, [("popularity", -1), ("id", -1)]),
+    ("category by price", {"category": "Beach"}, [("price", 1), ("id", 1)]),
+    ("category newest", {"category": "Beach"}, [("created_at", -1), ("id", -1)]),
+    ("destination newest", {"destination": "Male"}, [("created_at", -1), ("id", -1)]),
+    ("price range newest", {"price": {"$gte": 100, "$lte": 1000}}, [("created_at", -1), ("id", -1)]),
+]
+
+# Plan stages that mean a query isn't served by an index
+_BAD_STAGES = {"COLLSCAN", "SORT"}
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key in ("inputStage", "queryPlan"):
+            if key in node:
+                stack.append(node[key])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+async def ensure_offer_indexes(collection):
+    for keys, options in OFFER_INDEXES:
+        await collection.create_index(keys, **options)
+
+async def check_query_plans(collection, limit: int = 20) -> List[str]:
+    """
+    Explain each canonical query and log any that fall back to a collection
+    scan or an in-memory sort. Returns the descriptions of the bad ones.
+    """
+    bad = []
+    checked = 0
+    for description, query, sort in CANONICAL_QUERIES:
+        try:
+            explain = await collection.find(query).sort(sort).limit(limit).explain()
+        except Exception as e:
+            logger.warning("Could not explain '%s' query: %s", description, e)
+            continue
+        checked += 1
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning)
+        offending = sorted(_BAD_STAGES.intersection(stages))
+        if offending:
+            bad.append(description)
+            logger.warning(
+                "Query '%s' (filter=%s sort=%s) uses %s: %s",
+                description, query, sort, "/".join(offending), " <- ".join(stages),
+            )
+    if checked and not bad:
+        logger.info("All %d explained offer queries are index-backed", checked)
+    return bad
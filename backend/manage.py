@@ -0,0 +1,123 @@
+"""
+Maintenance commands for the travel offers backend.
+
+Usage (from the backend directory):
+    python manage.py migrate-images
+    python manage.py generate-variants
+    python manage.py rebuild-category-stats
+    python manage.py migrate [--status]
+"""
+import asyncio
+import logging
+
+import typer
+from starlette.concurrency import run_in_threadpool
+
+from media import IMAGE_EXTENSIONS, InvalidImage, generate_variants, is_data_uri
+from server import catalog_cache, catalog_versions, category_stats, db, image_store, migrator
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(help="Maintenance commands for the travel offers backend")
+
+async def _migrate_images() -> int:
+    image_store.ensure_root()
+    converted = 0
+
+    async for offer in db.travel_offers.find({"images": {"$regex": "^data:"}}, {"id": 1, "images": 1}):
+        images = []
+        for url in offer.get("images") or []:
+            if is_data_uri(url):
+                try:
+                    url = await run_in_threadpool(image_store.save_data_uri, url)
+                    await run_in_threadpool(generate_variants, str(image_store.path_for_url(url)))
+                    converted += 1
+                except InvalidImage as e:
+                    logger.warning("Skipping image of offer %s: %s", offer["id"], e)
+            images.append(url)
+        await db.travel_offers.update_one({"_id": offer["_id"]}, {"$set": {"images": images}})
+
+    async for ad in db.advertisements.find({"image_url": {"$regex": "^data:"}}, {"id": 1, "image_url": 1}):
+        try:
+            url = await run_in_threadpool(image_store.save_data_uri, ad["image_url"])
+        except InvalidImage as e:
+            logger.warning("Skipping image of advertisement %s: %s", ad["id"], e)
+            continue
+        await db.advertisements.update_one({"_id": ad["_id"]}, {"$set": {"image_url": url}})
+        converted += 1
+
+    if converted:
+        await _invalidate_catalog()
+    return converted
+
+async def _invalidate_catalog():
+    """Make running workers drop cached catalog views after an offline edit"""
+    await catalog_cache.start()
+    try:
+        for collection in ("travel_offers", "advertisements"):
+            await catalog_versions.bump(collection)
+        for namespace in ("offers", "offer", "categories", "ads"):
+            await catalog_cache.invalidate_namespace(namespace)
+    finally:
+        await catalog_cache.close()
+
+def _original_images():
+    """Originals in the image store (variants have a second suffix)"""
+    extensions = {f".{ext}" for ext in IMAGE_EXTENSIONS.values()}
+    for path in image_store.root.glob("*/*/*"):
+        if path.suffix in extensions and "." not in path.stem:
+            yield path
+
+@cli.command("migrate-images")
+def migrate_images():
+    """Move base64 data: URIs stored in offers and ads into the image store"""
+    converted = asyncio.run(_migrate_images())
+    typer.echo(f"Moved {converted} inline images to {image_store.root}")
+
+@cli.command("generate-variants")
+def generate_all_variants():
+    """Render missing thumb/card/hero variants for every stored image"""
+    written = 0
+    for path in _original_images():
+        try:
+            written += generate_variants(str(path))
+        except Exception as e:
+            logger.warning("Could not generate variants of %s: %s", path.name, e)
+    typer.echo(f"Wrote {written} variant files")
+
+async def _rebuild_category_stats() -> int:
+    categories = await category_stats.rebuild()
+    await catalog_cache.start()
+    try:
+        await catalog_cache.invalidate_namespace("categories")
+    finally:
+        await catalog_cache.close()
+    return categories
+
+@cli.command("rebuild-category-stats")
+def rebuild_category_stats():
+    """Recompute per-category offer counts and price ranges from the offers"""
+    categories = asyncio.run(_rebuild_category_stats())
+    typer.echo(f"Rebuilt stats for {categories} categories")
+
+async def _migrate(status: bool):
+    if status:
+        return await migrator.status()
+    return await migrator.wait_until_current()
+
+@cli.command("migrate")
+def migrate(status: bool = typer.Option(False, "--status", help="List applied and pending steps without running any")):
+    """Apply pending schema migrations (waits if a worker is already applying them)"""
+    result = asyncio.run(_migrate(status))
+    if not status:
+        typer.echo(f"Applied {result} migrations; schema at version {migrator.version}")
+        return
+    for step in result["applied"]:
+        typer.echo(f"  [x] {step['_id']:>3} {step['description']} ({step['applied_at']}, {step['duration_ms']} ms)")
+    for step in result["pending"]:
+        typer.echo(f"  [ ] {step['version']:>3} {step['description']}")
+    if result["lock"]:
+        typer.echo(f"Locked by {result['lock']['owner']} until {result['lock']['expires_at'].isoformat()}")
+
+if __name__ == "__main__":
+    cli()
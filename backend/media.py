@@ -0,0 +1,199 @@
+"""
+Content-addressed image store on local disk.
+
+Uploads are stored once per distinct content under
+    <root>/<sha[:2]>/<sha[2:4]>/<sha>.<ext>
+and referenced from documents by a short URL under MEDIA_URL_PREFIX.
+Because a path never changes content, nginx can serve these files
+with an immutable, year-long cache lifetime.
+
+Resized variants (thumb, card, hero) are written next to the original as
+    <sha>.<variant>.<webp|jpg>
+by generate_variants, which runs in a separate process pool.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Content types we accept, and the extension each is stored under
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/avif": "avif",
+}
+
+# Variant name -> maximum width in pixels (never upscaled)
+VARIANT_WIDTHS = {
+    "thumb": 320,
+    "card": 640,
+    "hero": 1600,
+}
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+_DATA_URI = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+);base64,(?P<data>.*)$", re.DOTALL)
+
+class InvalidImage(ValueError):
+    pass
+
+def _write_atomically(path: Path, write: Callable[[BinaryIO], Any]):
+    """
+    Write to a temp file in the target directory and rename it into place,
+    so readers never see a partial file and concurrent writers can't collide.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+class ImageStore:
+    def __init__(self, root: str, url_prefix: str, max_bytes: int):
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_bytes = max_bytes
+
+    def ensure_root(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def relative_path(self, digest: str, ext: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+    def url_for(self, relative_path: str) -> str:
+        return f"{self.url_prefix}/{relative_path}"
+
+    def path_for_url(self, url: str) -> Optional[Path]:
+        """Map one of our media URLs back to its file, or None for foreign URLs"""
+        if not url.startswith(self.url_prefix + "/"):
+            return None
+        return self.root / url[len(self.url_prefix) + 1:]
+
+    def variant_urls(self, url: Optional[str]) -> Optional[Dict[str, Dict[str, str]]]:
+        """URLs of the resized variants of one of our images, or None for foreign URLs"""
+        if not url or not url.startswith(self.url_prefix + "/"):
+            return None
+        base = url.rsplit(".", 1)[0]
+        return {
+            variant: {fmt: f"{base}.{variant}.{fmt}" for fmt in VARIANT_FORMATS}
+            for variant in VARIANT_WIDTHS
+        }
+
+    def save(self, contents: bytes, content_type: Optional[str]) -> str:
+        """
+        Store image bytes and return their URL. Blocking: call it from a
+        worker thread. Identical content is written only once.
+        """
+        ext = IMAGE_EXTENSIONS.get((content_type or "").lower())
+        if ext is None:
+            raise InvalidImage(f"Unsupported image type: {content_type}")
+        if not contents:
+            raise InvalidImage("Empty upload")
+        if len(contents) > self.max_bytes:
+            raise InvalidImage(f"Image is larger than {self.max_bytes} bytes")
+
+        digest = hashlib.sha256(contents).hexdigest()
+        relative = self.relative_path(digest, ext)
+        path = self.root / relative
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomically(path, lambda f: f.write(contents))
+            logger.info("Stored image %s (%d bytes)", relative, len(contents))
+        return self.url_for(relative)
+
+    def save_data_uri(self, uri: str) -> str:
+        """Store the payload of a base64 data: URI and return its URL"""
+        match = _DATA_URI.match(uri)
+        if match is None:
+            raise InvalidImage("Not a base64 data URI")
+        try:
+            contents = base64.b64decode(match.group("data"), validate=False)
+        except (binascii.Error, ValueError):
+            raise InvalidImage("Malformed base64 payload")
+        return self.save(contents, match.group("type"))
+
+def generate_variants(path: str) -> int:
+    """
+    Write the resized WebP/JPEG variants of an original image. CPU-bound and
+    blocking: run it in a process pool. Existing variants are left alone, so
+    re-running it for a deduplicated upload is cheap. Returns the number of
+    files written.
+    """
+    from PIL import Image, ImageOps
+
+    original = Path(path)
+    base = str(original.with_suffix(""))
+    written = 0
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for variant, width in VARIANT_WIDTHS.items():
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+                target = Path(f"{base}.{variant}.{fmt}")
+                if target.exists():
+                    continue
+                frame = resized.convert("RGB") if pil_format == "JPEG" else resized
+                _write_atomically(target, lambda f: frame.save(f, pil_format, **options))
+                written += 1
+    return written
+
+def is_data_uri(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("data:")
+
+class VariantPipeline:
+    """
+    Runs generate_variants in a bounded process pool, off the request path.
+    Callers fire and forget; failures are logged, and clients fall back to
+    the original image until the variants exist.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def submit(self, path: Path):
+        if self._pool is None:
+            # spawn, not fork: the server process runs threads (Mongo monitors, executors)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self.pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self._pool, generate_variants, str(path))
+        future.add_done_callback(lambda f: self._done(path, f))
+
+    def _done(self, path: Path, future: "asyncio.Future"):
+        self.pending -= 1
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.warning("Could not generate variants of %s: %s", path.name, error)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
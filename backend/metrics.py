@@ -0,0 +1,161 @@
+"""
+Prometheus metrics for the API.
+
+MetricsMiddleware times every request and labels it with its route
+template (/api/offers/{offer_id}, not the raw path) so series stay bounded.
+MongoCommandMetrics is a pymongo CommandListener timing each database
+command by collection and command name. observe_cache is the
+QueryCache.observer hook for hit/miss counters.
+
+The metrics are exposed by metrics_response(), mounted at /metrics on
+the backend port only (nginx doesn't route it).
+
+With several uvicorn workers, a scrape reaches one arbitrary worker. Set
+PROMETHEUS_MULTIPROC_DIR (before the workers start) to an empty directory
+shared by them: each worker then writes its samples there and any worker
+answers a scrape with the sum over all of them.
+"""
+import os
+import time
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from pymongo import monitoring
+from starlette.responses import Response
+from starlette.routing import Match
+
+# Read by prometheus_client at import time, so it must be set before the workers start
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template and status",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled",
+    ["method", "route"],
+    # Summed over live workers only
+    multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Response body size by route template",
+    ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency by collection and command",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "MongoDB commands that returned an error",
+    ["collection", "command"],
+)
+CACHE_REQUESTS = Counter(
+    "catalog_cache_requests_total",
+    "Catalog cache lookups by namespace and the tier that answered (local, redis or miss)",
+    ["namespace", "tier"],
+)
+
+# Requests no route matched share one label instead of one series per path
+UNMATCHED_ROUTE = "<unmatched>"
+
+def route_template(app, scope) -> str:
+    """The path template of the route a request will be dispatched to"""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are measured as they are sent"""
+
+    def __init__(self, app, router):
+        self.app = app
+        # The FastAPI app whose routes name the series
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(self.router, scope)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times database commands; register it with the client's event_listeners"""
+
+    # Commands whose first value isn't a collection name
+    _COLLECTION_FIELDS = {"getMore": "collection"}
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, int], Tuple[str, str]] = {}
+
+    def _key(self, event) -> Tuple[str, int]:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        command = event.command_name
+        field = self._COLLECTION_FIELDS.get(command, command)
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._pending[self._key(event)] = (collection, command)
+
+    def _finish(self, event):
+        return self._pending.pop(self._key(event), ("-", event.command_name))
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        MONGO_LATENCY.labels(collection, command).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection, command = self._finish(event)
+        MONGO_LATENCY.labels(collection, command).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(collection, command).inc()
+
+def observe_cache(namespace: str, tier: str):
+    CACHE_REQUESTS.labels(namespace, tier).inc()
+
+def metrics_response() -> Response:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+def mark_worker_exited():
+    """Drop this worker's live gauges from the shared multiprocess files"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
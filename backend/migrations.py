@@ -0,0 +1,253 @@
+"""
+Versioned schema migrations (collections, indexes, data backfills).
+
+Each step is an async function of the database, registered in order with
+@migration(version, description). Applied steps are recorded in
+schema_migrations as
+    {"_id": version, "description", "applied_at", "duration_ms", "applied_by"}
+so a step runs once per database, not once per worker start.
+
+Migrator.run() holds a lease on one document in migration_lock while it
+applies pending steps, so with several workers (or several containers)
+exactly one process migrates and the others wait for it to finish. The
+lease is renewed while steps run and expires if the holder dies, so a
+crashed deploy doesn't wedge the next one. Because of that, a step may be
+re-run after a crash and must be idempotent (create_index, $exists-guarded
+updates, ...). Released steps never change; add a new one instead.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from category_stats import CategoryStats
+from indexes import ensure_offer_indexes
+
+logger = logging.getLogger(__name__)
+
+LOCK_ID = "schema"
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Any], Awaitable[None]]
+
+MIGRATIONS: List[Migration] = []
+
+def migration(version: int, description: str):
+    """Register a step; versions must be added in increasing order"""
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered after {MIGRATIONS[-1].version}")
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return register
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+# --- Steps ---
+
+@migration(1, "create collections")
+async def create_collections(db):
+    existing = set(await db.list_collection_names())
+    for name in ("admin_users", "travel_offers", "categories", "advertisements"):
+        # Databases from before migrations already have some of them
+        if name not in existing:
+            await db.create_collection(name)
+
+@migration(2, "base indexes")
+async def base_indexes(db):
+    await db.travel_offers.create_index("id", unique=True)
+    await db.travel_offers.create_index("destination")
+    await db.travel_offers.create_index("category")
+    await db.travel_offers.create_index("price")
+    await db.travel_offers.create_index(
+        [
+            ("title", "text"),
+            ("destination", "text"),
+            ("description", "text"),
+            ("highlights", "text"),
+        ],
+        weights={"title": 10, "destination": 8, "highlights": 3, "description": 1},
+        name="offer_text_search",
+    )
+    await db.admin_users.create_index("username", unique=True)
+    await db.categories.create_index("id", unique=True)
+    await db.categories.create_index("name", unique=True)
+    await db.advertisements.create_index("id", unique=True)
+    await db.advertisements.create_index("placement.location")
+    await db.advertisements.create_index("is_active")
+    await db.ad_stats.create_index([("ad_id", 1), ("day", -1)], unique=True)
+    await db.ad_stats.create_index("day")
+
+@migration(3, "offer popularity backfill")
+async def popularity_backfill(db):
+    # Offers created before view counting start from zero, so popularity sorts and pages cleanly
+    await db.travel_offers.update_many(
+        {"popularity": {"$exists": False}},
+        {"$set": {"popularity": 0, "view_count": 0}},
+    )
+
+@migration(4, "offer list indexes")
+async def offer_list_indexes(db):
+    await ensure_offer_indexes(db.travel_offers)
+
+@migration(5, "category stats")
+async def build_category_stats(db):
+    stats = CategoryStats(db.category_stats, db.travel_offers)
+    await stats.ensure_indexes()
+    if await db.category_stats.estimated_document_count() == 0:
+        await stats.rebuild()
+
+@migration(6, "catalog event relay expiry")
+async def catalog_event_expiry(db):
+    # Relayed live events are only needed until every worker has polled them
+    await db.catalog_events.create_index("at", expireAfterSeconds=3600)
+
+@migration(7, "log2 popularity scores")
+async def popularity_log_scores(db):
+    # Scores used to be plain sums of 2^(age / half-life), which overflow; they are now
+    # log2 of that sum (0 = no views). The old value is kept aside so a re-run skips the document.
+    await db.travel_offers.update_many(
+        {"popularity_linear": {"$exists": False}},
+        [{
+            "$set": {
+                "popularity_linear": {"$ifNull": ["$popularity", 0]},
+                "popularity": {
+                    "$cond": [
+                        {"$gt": [{"$ifNull": ["$popularity", 0]}, 1]},
+                        {"$log": ["$popularity", 2]},
+                        0,
+                    ]
+                },
+            }
+        }],
+    )
+
+@migration(8, "drop linear popularity scores")
+async def drop_linear_popularity(db):
+    await db.travel_offers.update_many({"popularity_linear": {"$exists": True}}, {"$unset": {"popularity_linear": ""}})
+
+# --- Runner ---
+
+class Migrator:
+    def __init__(self, db, lease_seconds: float = 60, poll_interval: float = 1):
+        self.db = db
+        self.applied_collection = db.schema_migrations
+        self.locks = db.migration_lock
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        # Unique per process, so a restarted worker doesn't inherit a stale lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.version: Optional[int] = None
+
+    async def applied(self) -> List[Dict[str, Any]]:
+        cursor = self.applied_collection.find({}).sort("_id", 1)
+        return await cursor.to_list(length=None)
+
+    async def pending(self) -> List[Migration]:
+        done = {doc["_id"] for doc in await self.applied()}
+        return [step for step in MIGRATIONS if step.version not in done]
+
+    async def _acquire(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.locks.update_one(
+                {"_id": LOCK_ID, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The lock document exists and someone else's lease is live
+            return False
+        return True
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await self.locks.update_one(
+                    {"_id": LOCK_ID, "owner": self.owner},
+                    {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+                )
+                if result.matched_count == 0:
+                    logger.warning("Lost the migration lease to another process")
+            except Exception as e:
+                logger.warning("Could not renew the migration lease: %s", e)
+
+    async def _release(self):
+        await self.locks.delete_one({"_id": LOCK_ID, "owner": self.owner})
+
+    async def run(self) -> Optional[int]:
+        """
+        Apply pending steps if the lock is free. Returns how many were
+        applied, or None when another process holds the lock.
+        """
+        if not await self._acquire():
+            return None
+        renewal = asyncio.create_task(self._renew())
+        try:
+            # Re-read under the lock: the previous holder may have just finished
+            steps = await self.pending()
+            for step in steps:
+                logger.info("Applying migration %d: %s", step.version, step.description)
+                start = time.perf_counter()
+                await step.apply(self.db)
+                await self.applied_collection.replace_one(
+                    {"_id": step.version},
+                    {
+                        "_id": step.version,
+                        "description": step.description,
+                        "applied_at": datetime.utcnow().isoformat(),
+                        "duration_ms": round((time.perf_counter() - start) * 1000),
+                        "applied_by": self.owner,
+                    },
+                    upsert=True,
+                )
+            self.version = latest_version()
+            return len(steps)
+        finally:
+            renewal.cancel()
+            await self._release()
+
+    async def wait_until_current(self) -> int:
+        """
+        Return once every registered step is applied, by this process or
+        another one. Failures are logged and retried. Returns the number of
+        steps this process applied.
+        """
+        while True:
+            try:
+                if not await self.pending():
+                    self.version = latest_version()
+                    return 0
+                applied = await self.run()
+                if applied is not None:
+                    return applied
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Migration failed, retrying: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def status(self) -> Dict[str, Any]:
+        applied = await self.applied()
+        done = {doc["_id"] for doc in applied}
+        return {
+            "latest": latest_version(),
+            "applied": applied,
+            "pending": [
+                {"version": step.version, "description": step.description}
+                for step in MIGRATIONS if step.version not in done
+            ],
+            "lock": await self.locks.find_one({"_id": LOCK_ID}),
+        }
@@ -0,0 +1,114 @@
+"""
+Password hashing off the event loop, and login attempt throttling.
+
+bcrypt deliberately burns 100-300 ms of CPU per check. PasswordHasher runs
+it in a small dedicated thread pool (bcrypt releases the GIL) and refuses
+new work once its queue is full, so a login flood slows down logins only.
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Hashable, Optional
+
+from passlib.context import CryptContext
+
+class HasherBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+class PasswordHasher:
+    def __init__(self, context: CryptContext, max_workers: int = 2, max_queue: int = 32):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        # Checks submitted and not yet finished (running + waiting)
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+
+    @property
+    def queue_depth(self) -> int:
+        """Checks waiting for a free worker"""
+        return max(self.in_flight - self.max_workers, 0)
+
+    async def _run(self, fn, *args):
+        if self.queue_depth >= self.max_queue:
+            raise HasherBusy()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "active": min(self.in_flight, self.max_workers),
+            "queued": self.queue_depth,
+            "max_queue": self.max_queue,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class LoginThrottle:
+    """
+    Sliding-window limits on login attempts: all attempts per client IP,
+    and failed attempts per (username, client IP). Failures are not counted
+    per username alone, or anyone could lock the admin out by failing on
+    purpose.
+
+    State lives in this worker's memory. Requests are spread over
+    WEB_CONCURRENCY workers, so the effective limits are up to that many
+    times the configured ones.
+    """
+
+    def __init__(self, max_per_ip: int, max_failures_per_user: int, window: float, max_keys: int = 10000):
+        self.max_per_ip = max_per_ip
+        self.max_failures_per_user = max_failures_per_user
+        self.window = window
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._attempts: Dict[Hashable, Deque[float]] = {}
+        self._failures: Dict[Hashable, Deque[float]] = {}
+
+    def _recent(self, buckets: Dict[Hashable, Deque[float]], key: Hashable, now: float) -> Deque[float]:
+        events = buckets.get(key)
+        if events is None:
+            if len(buckets) >= self.max_keys:
+                self._prune(buckets, now)
+            events = buckets[key] = deque()
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return events
+
+    def _prune(self, buckets: Dict[Hashable, Deque[float]], now: float):
+        for key in [k for k, events in buckets.items() if not events or events[-1] <= now - self.window]:
+            del buckets[key]
+
+    def check(self, ip: str, username: str) -> Optional[float]:
+        """
+        Record an attempt. Returns None when it may proceed, otherwise the
+        number of seconds until the client may retry.
+        """
+        now = time.monotonic()
+        attempts = self._recent(self._attempts, ip, now)
+        failures = self._recent(self._failures, (username, ip), now)
+        for events, limit in ((attempts, self.max_per_ip), (failures, self.max_failures_per_user)):
+            if len(events) >= limit:
+                self.rejected += 1
+                return max(events[0] + self.window - now, 1)
+        attempts.append(now)
+        return None
+
+    def record_failure(self, ip: str, username: str):
+        now = time.monotonic()
+        self._recent(self._failures, (username, ip), now).append(now)
+
+    def record_success(self, ip: str, username: str):
+        self._failures.pop((username, ip), None)
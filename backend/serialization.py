@@ -0,0 +1,43 @@
+"""
+Single-pass JSON encoding for MongoDB documents.
+
+Documents coming out of Motor are encoded straight to bytes with orjson,
+instead of going through bson.json_util, json.loads and FastAPI's
+jsonable_encoder in turn.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Projection that keeps Mongo's internal _id out of API payloads.
+# Every document already carries its own string "id".
+NO_ID = {"_id": 0}
+
+_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+def _default(obj: Any) -> Any:
+    """Handle the BSON and model types orjson doesn't know natively"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(data: Any) -> bytes:
+    """Encode documents (or lists of them) to JSON bytes in one pass"""
+    return orjson.dumps(data, default=_default, option=_OPTIONS)
+
+class MongoJSONResponse(JSONResponse):
+    """JSON response that renders Mongo documents without intermediate copies"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,19 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form, Body
+from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form, Body, Query, Response, Header, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-from typing import List, Optional, Dict, Any
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from motor.motor_asyncio import AsyncIOMotorClient
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field, EmailStr, validator
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import uuid
 import json
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+import asyncio
 import base64
-from bson import json_util
+import hashlib
 import logging
+import signal
+import threading
+
+from ads import AdIndex
+from bulk import BulkDeleteRequest, BulkRequest, bulk_delete, bulk_insert, bulk_update
+from cache import PrincipalCache, QueryCache, VersionCounter
+from category_stats import CategoryStats
+from events import RESYNC, EventBus
+from indexes import SORTABLE_FIELDS, check_query_plans
+from media import ImageStore, InvalidImage, VariantPipeline, is_data_uri
+from migrations import Migrator
+from metrics import MetricsMiddleware, MongoCommandMetrics, mark_worker_exited, metrics_response, observe_cache
+from security import HasherBusy, LoginThrottle, PasswordHasher
+from serialization import MongoJSONResponse, NO_ID, dumps
+from snapshots import SnapshotStore, accepted_encoding
+from tracking import CounterBuffer, forward_decay_log_weight
+from transfer import NDJSON_MEDIA_TYPE, export_cursor, export_ndjson, import_ndjson
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -23,23 +43,176 @@ logger = logging.getLogger(__name__)
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "travel_db")
 
+# Connection pool sizing (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
 # Security configuration
 SECRET_KEY = "supersecretkey"  # In production, use a secure environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URL)
+# Catalog reads may be stored but must be revalidated (ETag / If-None-Match)
+CATALOG_CACHE_CONTROL = "public, no-cache"
+
+# Uploaded images: content-addressed files, served by nginx with immutable caching
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+MEDIA_URL_PREFIX = os.environ.get("MEDIA_URL_PREFIX", "/api/media")
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Processes used to render thumb/card/hero variants of uploads
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+# Prometheus metrics at /metrics on the backend port (request, Mongo and cache series)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+# /api/health/ready reports unready if Mongo doesn't answer a ping within this time
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_PING_TIMEOUT_SECONDS", "2"))
+
+# A migrating worker's lock expires this long after its last renewal (e.g. if it crashed)
+MIGRATION_LEASE_SECONDS = float(os.environ.get("MIGRATION_LEASE_SECONDS", "60"))
+# Pause between attempts when a startup step after the migrations fails
+STARTUP_RETRY_SECONDS = float(os.environ.get("STARTUP_RETRY_SECONDS", "2"))
+
+# Explain the canonical offer queries at startup and warn about COLLSCAN / in-memory SORT
+EXPLAIN_CHECK_ON_STARTUP = os.environ.get("EXPLAIN_CHECK_ON_STARTUP", "true").lower() == "true"
+
+# Pseudo sort key for ranking full-text search results
+RELEVANCE_SORT = "relevance"
+# Facet mode of GET /api/offers: destinations listed, price histogram buckets
+FACET_DESTINATION_LIMIT = 20
+PRICE_HISTOGRAM_BUCKETS = 8
+
+# bcrypt runs in its own small pool; a full queue turns logins away instead of piling up
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))
+# Login throttling (sliding window, per worker); failures count per (username, client IP)
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get("LOGIN_MAX_ATTEMPTS_PER_IP", "20"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_THROTTLE_WINDOW_SECONDS = float(os.environ.get("LOGIN_THROTTLE_WINDOW_SECONDS", "300"))
+
+# Ad rotation: how often workers check for ad changes, and the most ads one request may draw
+AD_INDEX_REFRESH_SECONDS = float(os.environ.get("AD_INDEX_REFRESH_SECONDS", "1"))
+AD_PICK_MAX = 10
+# Impression / click counters are buffered and written every few seconds or N events
+AD_STATS_FLUSH_SECONDS = float(os.environ.get("AD_STATS_FLUSH_SECONDS", "5"))
+AD_STATS_FLUSH_EVENTS = int(os.environ.get("AD_STATS_FLUSH_EVENTS", "1000"))
+AD_STATS_MAX_DAYS = 366
+
+# Offer detail views are counted write-behind into view_count / popularity
+OFFER_VIEWS_FLUSH_SECONDS = float(os.environ.get("OFFER_VIEWS_FLUSH_SECONDS", "30"))
+OFFER_VIEWS_FLUSH_EVENTS = int(os.environ.get("OFFER_VIEWS_FLUSH_EVENTS", "5000"))
+# A view's weight in the popularity score halves every POPULARITY_HALF_LIFE_DAYS (at least an hour).
+# Scores are log2 sums relative to POPULARITY_EPOCH, which must never change once views are recorded.
+POPULARITY_HALF_LIFE_DAYS = max(float(os.environ.get("POPULARITY_HALF_LIFE_DAYS", "7")), 1 / 24)
+POPULARITY_EPOCH = datetime(2024, 1, 1)
+
+# Pre-compressed (gzip / brotli) files of the hottest catalog reads, rebuilt after
+# offer writes. nginx serves them from SNAPSHOT_DIR via X-Accel-Redirect.
+SNAPSHOTS_ENABLED = os.environ.get("SNAPSHOTS_ENABLED", "true").lower() == "true"
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+SNAPSHOT_DEBOUNCE_SECONDS = float(os.environ.get("SNAPSHOT_DEBOUNCE_SECONDS", "0.5"))
+
+# Live catalog events (SSE at /api/events): per-client queue bound, replay buffer
+# for reconnects, clients per worker, keep-alive comment interval
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_REPLAY_SIZE = int(os.environ.get("EVENTS_REPLAY_SIZE", "1024"))
+EVENTS_MAX_CLIENTS = int(os.environ.get("EVENTS_MAX_CLIENTS", "1000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Without Redis, workers pick up each other's events from catalog_events this often
+EVENTS_POLL_SECONDS = float(os.environ.get("EVENTS_POLL_SECONDS", "0.5"))
+# A write touching more documents than this sends one resync instead of per-document events
+EVENTS_MAX_BATCH = 100
+
+# Above this many ids, a bulk write drops cached offer details wholesale
+BULK_INVALIDATE_THRESHOLD = 100
+
+# Pagination for list endpoints
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "500"))
+
+# Catalog cache: short-lived in-process tier, optional Redis tier shared by workers
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "5"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.environ.get("REDIS_URL")
+REDIS_CACHE_TTL_SECONDS = float(os.environ.get("REDIS_CACHE_TTL_SECONDS", "300"))
+# How long a verified admin token is trusted without re-reading admin_users
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# How long a worker trusts its copy of a collection's version when checking ETags
+CATALOG_VERSION_TTL_SECONDS = float(os.environ.get("CATALOG_VERSION_TTL_SECONDS", "1"))
+
+# Connect to MongoDB (async driver, so queries don't block the event loop).
+# connect=False defers server discovery to the first operation, so importing
+# this module (manage.py, benchmark.py, workers) doesn't wait on the network
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    connect=False,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[MongoCommandMetrics()] if METRICS_ENABLED else [],
+)
 db = client[DB_NAME]
 
+catalog_cache = QueryCache(
+    maxsize=CACHE_MAX_ENTRIES,
+    ttl=CACHE_TTL_SECONDS,
+    redis_url=REDIS_URL,
+    redis_ttl=REDIS_CACHE_TTL_SECONDS,
+    enabled=CACHE_ENABLED,
+)
+if METRICS_ENABLED:
+    catalog_cache.observer = observe_cache
+events = EventBus(
+    db.catalog_events,
+    redis_url=REDIS_URL,
+    poll_interval=EVENTS_POLL_SECONDS,
+    queue_size=EVENTS_QUEUE_SIZE,
+    replay_size=EVENTS_REPLAY_SIZE,
+    max_clients=EVENTS_MAX_CLIENTS,
+)
+principal_cache = PrincipalCache(ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+catalog_versions = VersionCounter(db.collection_versions, ttl=CATALOG_VERSION_TTL_SECONDS)
+category_stats = CategoryStats(db.category_stats, db.travel_offers)
+migrator = Migrator(db, lease_seconds=MIGRATION_LEASE_SECONDS)
+snapshots = SnapshotStore(
+    SNAPSHOT_DIR,
+    lambda: catalog_versions.get("travel_offers"),
+    debounce=SNAPSHOT_DEBOUNCE_SECONDS,
+    enabled=SNAPSHOTS_ENABLED,
+)
+ad_index = AdIndex(db.advertisements, catalog_versions, refresh_interval=AD_INDEX_REFRESH_SECONDS)
+ad_counters = CounterBuffer(db.ad_stats, flush_interval=AD_STATS_FLUSH_SECONDS, flush_threshold=AD_STATS_FLUSH_EVENTS)
+offer_views = CounterBuffer(
+    db.travel_offers,
+    flush_interval=OFFER_VIEWS_FLUSH_SECONDS,
+    flush_threshold=OFFER_VIEWS_FLUSH_EVENTS,
+    upsert=False,
+    on_flush=lambda: invalidate_popularity_caches(),
+    log_fields=("popularity",),
+)
+
+image_store = ImageStore(MEDIA_ROOT, MEDIA_URL_PREFIX, MAX_UPLOAD_BYTES)
+image_variants = VariantPipeline(IMAGE_WORKERS)
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+login_throttle = LoginThrottle(
+    max_per_ip=LOGIN_MAX_ATTEMPTS_PER_IP,
+    max_failures_per_user=LOGIN_MAX_FAILURES_PER_USER,
+    window=LOGIN_THROTTLE_WINDOW_SECONDS,
+)
 
 # OAuth2 token URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/admin/login")
 
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(default_response_class=MongoJSONResponse)
+# Set once startup has created the indexes and started the background tasks
+app.state.ready = False
 
 # Enable CORS
 app.add_middleware(
@@ -48,8 +221,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Has-More", "X-Total-Count"],
 )
 
+if METRICS_ENABLED:
+    # Added last, so it is outermost and times CORS handling too
+    app.add_middleware(MetricsMiddleware, router=app)
+
+# nginx serves MEDIA_ROOT directly in production; this mount covers local runs
+app.mount(MEDIA_URL_PREFIX, StaticFiles(directory=MEDIA_ROOT, check_dir=False), name="media")
+
 # --- Models ---
 
 class Token(BaseModel):
@@ -135,6 +316,9 @@ class TravelOffer(TravelOfferBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
     updated_at: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    # Maintained by the view counter, not by admin edits
+    view_count: int = 0
+    popularity: float = 0
     
     class Config(BaseConfig):
         pass
@@ -160,6 +344,18 @@ class AdPlacement(BaseModel):
     location: str
     description: Optional[str] = None
 
+def normalize_schedule_time(value: Optional[str]) -> Optional[str]:
+    """Ad schedule times are stored as naive UTC ISO strings, like created_at"""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("must be an ISO 8601 date/time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
 class AdvertisementBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -167,6 +363,13 @@ class AdvertisementBase(BaseModel):
     link_url: str
     placement: AdPlacement
     is_active: bool = True
+    # Relative share of its slot when ads are rotated
+    weight: float = Field(1.0, gt=0)
+    # Optional serving window (UTC)
+    starts_at: Optional[str] = None
+    ends_at: Optional[str] = None
+    
+    _normalize_schedule = validator("starts_at", "ends_at", allow_reuse=True)(normalize_schedule_time)
 
 class AdvertisementCreate(AdvertisementBase):
     pass
@@ -186,20 +389,61 @@ class AdvertisementUpdate(BaseModel):
     link_url: Optional[str] = None
     placement: Optional[AdPlacement] = None
     is_active: Optional[bool] = None
+    weight: Optional[float] = Field(None, gt=0)
+    starts_at: Optional[str] = None
+    ends_at: Optional[str] = None
+    
+    _normalize_schedule = validator("starts_at", "ends_at", allow_reuse=True)(normalize_schedule_time)
+
+# Query parameters of GET /api/offers, also used to build its cache key
+class OfferListQuery(BaseModel):
+    q: Optional[str] = None
+    destination: Optional[str] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    sort_by: Optional[str] = None
+    sort_order: Optional[str] = None
+    limit: int = DEFAULT_PAGE_SIZE
+    cursor: Optional[str] = None
+    include_total: bool = False
+    facets: bool = False
+    view: str = "summary"
+    fields: Optional[Tuple[str, ...]] = None
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.dict().items() if v is not None and v is not False}
+
+# Ranking data kept by the view counter; never part of public responses
+OFFER_INTERNAL_FIELDS = ("view_count", "popularity")
+
+# Fields a listing card needs; everything else is left to the detail endpoint
+OFFER_SUMMARY_FIELDS = (
+    "id",
+    "title",
+    "destination",
+    "price",
+    "travel_dates",
+    "category",
+    "company_name",
+    "images",
+    "created_at",
+    "updated_at",
+)
 
 # --- Helper Functions ---
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
-def authenticate_user(username: str, password: str):
-    user = db.admin_users.find_one({"username": username})
+async def authenticate_user(username: str, password: str):
+    user = await db.admin_users.find_one({"username": username})
     if not user:
         return False
-    if not verify_password(password, user["hashed_password"]):
+    if not await verify_password(password, user["hashed_password"]):
         return False
     return user
 
@@ -219,6 +463,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Tokens verified recently need neither signature checks nor a user lookup,
+    # unless an admin account changed since (on any worker)
+    principals_version = await catalog_versions.get("admin_users")
+    cached_user = principal_cache.get(token, principals_version)
+    if cached_user is not None:
+        return cached_user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -227,108 +477,616 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.admin_users.find_one({"username": token_data.username})
+    user = await db.admin_users.find_one({"username": token_data.username})
     if user is None:
         raise credentials_exception
+    principal_cache.set(token, user, expires_at=payload["exp"], version=principals_version)
     return user
 
-def parse_json(data):
+def encode_cursor(sort_field: str, sort_direction: int, state: dict) -> str:
+    """
+    Build an opaque cursor from the position after the last document of a page.
+    The cursor pins the sort so it can't be replayed against another ordering.
+    """
+    payload = {"s": sort_field, "d": sort_direction, **state}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort_field: str, sort_direction: int) -> dict:
+    """Unpack a cursor issued by encode_cursor for the same sort order"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload["s"] != sort_field or payload["d"] != sort_direction:
+            raise ValueError("cursor was issued for a different sort order")
+        if sort_field == RELEVANCE_SORT:
+            if not isinstance(payload["o"], int) or payload["o"] < 0:
+                raise ValueError("bad offset")
+        elif "v" not in payload or "id" not in payload:
+            raise ValueError("missing position")
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    return payload
+
+def parse_offer_fields(fields: str) -> Tuple[str, ...]:
+    """Validate a comma-separated `fields` parameter against the offer model"""
+    names = tuple(sorted({name.strip() for name in fields.split(",") if name.strip()}))
+    unknown = [name for name in names if name not in TravelOffer.__fields__ or name in OFFER_INTERNAL_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown offer fields: {', '.join(unknown)}")
+    return names
+
+def offer_projection(params: OfferListQuery, sort_field: str) -> dict:
+    """
+    Mongo projection for a list query, so unused fields never leave the
+    database. The id and sort key are always kept for the paging cursor.
+    """
+    if params.fields:
+        names = params.fields
+    elif params.view == "summary":
+        names = OFFER_SUMMARY_FIELDS
+    else:
+        # The sort key stays in until the paging cursor is built
+        return {**NO_ID, **{name: 0 for name in OFFER_INTERNAL_FIELDS if name != sort_field}}
+    projection = {**NO_ID, "id": 1, **{name: 1 for name in names}}
+    if sort_field != RELEVANCE_SORT:
+        projection[sort_field.split(".")[0]] = 1
+    if params.view == "summary" and not params.fields:
+        # Cards show a single image
+        projection["images"] = {"$slice": 1}
+    return projection
+
+def get_path(doc: dict, path: str):
+    """Read a dotted field path (e.g. travel_dates.start_date) from a document"""
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def keyset_after(state: dict, sort_field: str, sort_direction: int) -> dict:
+    """
+    Query fragment that resumes after the last (sort value, id) pair,
+    so each page is an index range scan.
     """
-    Convert MongoDB document to JSON serializable format.
-    Handle date objects explicitly.
+    op = "$gt" if sort_direction == 1 else "$lt"
+    return {
+        "$or": [
+            {sort_field: {op: state["v"]}},
+            {sort_field: state["v"], "id": {op: state["id"]}},
+        ]
+    }
+
+async def store_inline_image(url: str) -> str:
+    """Move a base64 data: URI into the image store and return its short URL"""
+    if not is_data_uri(url):
+        return url
+    try:
+        stored_url = await run_in_threadpool(image_store.save_data_uri, url)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image_variants.submit(image_store.path_for_url(stored_url))
+    return stored_url
+
+async def store_inline_images(urls: List[str]) -> List[str]:
+    return [await store_inline_image(url) for url in urls]
+
+def add_image_variants(offer: dict) -> dict:
+    """Attach resized variant URLs of the offer's lead image, when we host it"""
+    if "images" not in offer:
+        return offer
+    images = offer["images"]
+    offer["image_variants"] = image_store.variant_urls(images[0]) if images else None
+    return offer
+
+def cached_response(entry):
+    """Build a response from a (headers, body) cache entry without re-encoding"""
+    headers, body = entry
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def make_etag(version: str, cache_key: str) -> str:
+    """Strong ETag for one query of a collection at a given version"""
+    digest = hashlib.sha1(cache_key.encode("utf-8")).hexdigest()[:16]
+    return f'"v{version}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL})
+
+async def conditional_cached_response(collections, cache_key: str, if_none_match: Optional[str], load):
     """
-    def convert_dates(obj):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if isinstance(value, dict) and "$date" in value:
-                    obj[key] = datetime.fromisoformat(value["$date"].replace("Z", "+00:00"))
-                elif isinstance(value, dict):
-                    convert_dates(value)
-                elif isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, dict):
-                            convert_dates(item)
-        return obj
-    
-    # First convert to JSON format using bson.json_util
-    json_str = json_util.dumps(data)
-    parsed_data = json.loads(json_str)
-    
-    # Handle date objects
-    if isinstance(parsed_data, list):
-        for item in parsed_data:
-            convert_dates(item)
-    elif isinstance(parsed_data, dict):
-        convert_dates(parsed_data)
-    
-    return parsed_data
+    Serve a cached catalog read with ETag revalidation.
+
+    The ETag comes from the version counters of `collections` (a name or a
+    tuple of names), read *before* the query runs, so a tag can only ever
+    be older than the body it labels. When the client already holds the
+    current tag we answer 304 without touching the query or the serializer.
+    """
+    names = (collections,) if isinstance(collections, str) else collections
+    version = ".".join([str(await catalog_versions.get(name)) for name in names])
+    etag = make_etag(version, cache_key)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    async def load_tagged():
+        headers, body = await load()
+        return {**headers, "ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}, body
+
+    return cached_response(await catalog_cache.get_or_load(cache_key, load_tagged))
+
+def summary_changed(before: dict, changes: dict) -> bool:
+    """Whether an offer update moves it between categories or changes its price"""
+    return any(field in changes and changes[field] != before.get(field) for field in ("category", "price"))
+
+async def invalidate_offer_caches(*offer_ids, categories_changed=True):
+    """Drop cached public views affected by a write to travel_offers"""
+    await catalog_versions.bump("travel_offers")
+    snapshots.schedule()
+    await catalog_cache.invalidate_namespace("offers")
+    await catalog_cache.invalidate_namespace("offers_popular")
+    if len(offer_ids) > BULK_INVALIDATE_THRESHOLD:
+        # Cheaper to drop every cached detail than to delete thousands of keys
+        await catalog_cache.invalidate_namespace("offer")
+    else:
+        for offer_id in offer_ids:
+            await catalog_cache.invalidate(catalog_cache.key("offer", id=offer_id))
+    if categories_changed:
+        await catalog_cache.invalidate_namespace("categories")
+
+def offer_summary(offer: dict) -> dict:
+    return {field: offer[field] for field in OFFER_SUMMARY_FIELDS if field in offer}
+
+async def publish_offer_events(action: str, offers):
+    """Tell live clients about offer writes ("created", "updated" or "deleted")"""
+    offers = list(offers)
+    if len(offers) > EVENTS_MAX_BATCH:
+        await events.publish(RESYNC, {"reason": f"offers {action}", "count": len(offers)})
+        return
+    for offer in offers:
+        data = {"id": offer["id"]} if action == "deleted" else offer_summary(offer)
+        await events.publish(f"offer.{action}", data)
+
+async def publish_ad_events(action: str, ads):
+    """Tell live clients about advertisement writes"""
+    ads = list(ads)
+    if len(ads) > EVENTS_MAX_BATCH:
+        await events.publish(RESYNC, {"reason": f"advertisements {action}", "count": len(ads)})
+        return
+    for ad in ads:
+        if action == "deleted":
+            data = {"id": ad["id"], "placement": ad["placement"]}
+        else:
+            data = {k: v for k, v in ad.items() if k != "_id"}
+        await events.publish(f"ad.{action}", data)
+
+async def invalidate_popularity_caches():
+    """Drop popularity-ordered pages after view counts were written"""
+    await catalog_versions.bump("offer_popularity")
+    await catalog_cache.invalidate_namespace("offers_popular")
+
+def record_offer_view(offer_id: str):
+    """Count a detail view; written later in a batch by offer_views. Never fails the request."""
+    try:
+        weight = forward_decay_log_weight(datetime.utcnow(), POPULARITY_EPOCH, POPULARITY_HALF_LIFE_DAYS * 86400)
+        offer_views.add({"id": offer_id}, {"view_count": 1, "popularity": weight})
+    except Exception as e:
+        logger.warning("Could not count a view of offer %s: %s", offer_id, e)
+
+async def invalidate_ad_caches(*locations):
+    """Drop the cached advertisement lists that can contain ads from these placements"""
+    await catalog_versions.bump("advertisements")
+    # Other workers pick the change up on their next poll
+    await ad_index.refresh()
+    for location in {None, *locations}:
+        for active_only in (True, False):
+            await catalog_cache.invalidate(catalog_cache.key("ads", location=location, active_only=active_only))
 
 # --- API Routes ---
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (not routed by nginx)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return metrics_response()
+
 @app.get("/api/")
 async def root():
     return {"message": "Welcome to the Maldives Travel Offers API"}
 
+# Health probes (per worker; the entrypoint and orchestrator gate traffic on them)
+
+@app.get("/api/health/live")
+async def health_live():
+    """The worker's event loop is answering"""
+    return {"status": "ok"}
+
+@app.get("/api/health/ready")
+async def health_ready(response: Response):
+    """Startup finished (indexes exist) and MongoDB answers a ping"""
+    response.headers["Cache-Control"] = "no-store"
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting up")
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=HEALTH_PING_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.warning("Readiness ping failed: %s", e)
+        raise HTTPException(status_code=503, detail="Database unreachable")
+    return {"status": "ready"}
+
 # Public Endpoints
 
 @app.get("/api/offers")
 async def get_travel_offers(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200),
     destination: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     sort_by: Optional[str] = None,
     sort_order: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    facets: bool = False,
+    view: str = Query("summary", pattern="^(summary|full)$"),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ):
+    """
+    List travel offers one page at a time. The body stays a plain list;
+    paging state travels in the X-Next-Cursor / X-Has-More / X-Total-Count headers.
+
+    `q` runs a ranked full-text search over title, destination, description
+    and highlights; `destination` and `category` are exact-match filters.
+
+    By default each entry is a card-sized summary (view=summary); use
+    view=full or an explicit comma-separated `fields` list for more.
+    GET /api/offers/{offer_id} always returns the full document.
+
+    facets=true returns {"offers": [...], "facets": {...}} instead: the page
+    plus category / destination counts and a price histogram, from one
+    $facet aggregation. Each facet ignores its own filter, so the panel can
+    show the alternatives to the current choice.
+    """
+    if sort_by and sort_by not in SORTABLE_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort_by must be one of: {', '.join(SORTABLE_FIELDS)}",
+        )
+    params = OfferListQuery(
+        q=q.strip() if q else None,
+        destination=destination,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        limit=limit,
+        cursor=cursor,
+        include_total=include_total,
+        facets=facets,
+        view=view,
+        fields=parse_offer_fields(fields) if fields else None,
+    )
+    if sort_by == "popularity":
+        # Reordered by every view flush, so cached and tagged apart from the other pages
+        cache_key = catalog_cache.key("offers_popular", **params.cache_params())
+        collections = ("travel_offers", "offer_popularity")
+    else:
+        cache_key = catalog_cache.key("offers", **params.cache_params())
+        collections = ("travel_offers",)
+    
+    snapshot = await snapshot_response(request, cache_key, if_none_match)
+    if snapshot is not None:
+        return snapshot
+    
+    async def load():
+        if params.facets:
+            return await query_offer_facets(params)
+        return await query_travel_offers(params)
+    
+    return await conditional_cached_response(collections, cache_key, if_none_match, load)
+
+def offer_filter(params: OfferListQuery, exclude: Tuple[str, ...] = ()) -> dict:
+    """
+    Mongo filter for a list query. `exclude` leaves out named filters
+    (q, destination, category, price) so a facet can count its own alternatives.
+    """
     query = {}
+    # Exact matches, so they stay on the indexes
+    if params.q and "q" not in exclude:
+        query["$text"] = {"$search": params.q}
+    if params.destination and "destination" not in exclude:
+        query["destination"] = params.destination
+    if params.category and "category" not in exclude:
+        query["category"] = params.category
+    if "price" not in exclude:
+        if params.min_price is not None:
+            query["price"] = query.get("price", {})
+            query["price"]["$gte"] = params.min_price
+        if params.max_price is not None:
+            query["price"] = query.get("price", {})
+            query["price"]["$lte"] = params.max_price
+    return query
+
+def offer_sort(params: OfferListQuery) -> Tuple[str, int]:
+    """(sort field, direction) of a list query"""
+    if params.sort_by == "popularity" and not params.sort_order:
+        return "popularity", -1
+    if params.sort_by:
+        return params.sort_by, -1 if params.sort_order and params.sort_order.lower() == "desc" else 1
+    if params.q:
+        # Search results default to relevance order
+        return RELEVANCE_SORT, -1
+    # Default sorting by created_at (newest first)
+    return "created_at", -1
+
+def next_page_headers(offers: list, has_more: bool, sort_field: str, sort_direction: int, offset: int, limit: int) -> dict:
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if has_more:
+        if sort_field == RELEVANCE_SORT:
+            next_state = {"o": offset + limit}
+        else:
+            next_state = {"v": get_path(offers[-1], sort_field), "id": offers[-1]["id"]}
+        headers["X-Next-Cursor"] = encode_cursor(sort_field, sort_direction, next_state)
+    return headers
+
+async def query_travel_offers(params: OfferListQuery):
+    """Run the offer list query and return its (headers, body) cache entry"""
+    query = offer_filter(params)
+    sort_field, sort_direction = offer_sort(params)
+    
+    projection = offer_projection(params, sort_field)
+    if params.q:
+        projection["score"] = {"$meta": "textScore"}
+    
+    state = decode_cursor(params.cursor, sort_field, sort_direction) if params.cursor else None
     
-    # Apply filters
-    if destination:
-        query["destination"] = {"$regex": destination, "$options": "i"}
-    if category:
-        query["category"] = {"$regex": category, "$options": "i"}
-    if min_price is not None:
-        query["price"] = query.get("price", {})
-        query["price"]["$gte"] = min_price
-    if max_price is not None:
-        query["price"] = query.get("price", {})
-        query["price"]["$lte"] = max_price
-    
-    # Apply sorting
-    sort_params = []
-    if sort_by:
-        sort_direction = -1 if sort_order and sort_order.lower() == "desc" else 1
-        sort_params.append((sort_by, sort_direction))
+    offset = 0
+    if sort_field == RELEVANCE_SORT:
+        # Text scores can't be range-filtered, so relevance pages use an offset
+        offset = state["o"] if state else 0
+        sort_params = [("score", {"$meta": "textScore"}), ("id", 1)]
+        cursor = db.travel_offers.find(query, projection).sort(sort_params).skip(offset)
     else:
-        # Default sorting by created_at (newest first)
-        sort_params.append(("created_at", -1))
+        # id breaks ties so the keyset order is total
+        sort_params = [(sort_field, sort_direction), ("id", sort_direction)]
+        page_query = query
+        if state:
+            after = keyset_after(state, sort_field, sort_direction)
+            page_query = {"$and": [query, after]} if query else after
+        cursor = db.travel_offers.find(page_query, projection).sort(sort_params)
+    
+    # Fetch one extra document to learn whether another page exists
+    offers = await cursor.limit(params.limit + 1).to_list(length=None)
+    has_more = len(offers) > params.limit
+    offers = [add_image_variants(offer) for offer in offers[:params.limit]]
+    
+    headers = next_page_headers(offers, has_more, sort_field, sort_direction, offset, params.limit)
+    if sort_field in OFFER_INTERNAL_FIELDS:
+        for offer in offers:
+            offer.pop(sort_field, None)
+    if params.include_total:
+        if query:
+            total = await db.travel_offers.count_documents(query)
+        else:
+            total = await db.travel_offers.estimated_document_count()
+        headers["X-Total-Count"] = str(total)
+    
+    return headers, dumps(offers)
+
+def aggregation_projection(projection: dict) -> dict:
+    """Rewrite a find() projection for $project ({"$slice": n} becomes an expression)"""
+    return {
+        field: {"$slice": [f"${field}", spec["$slice"]]} if isinstance(spec, dict) and "$slice" in spec else spec
+        for field, spec in projection.items()
+    }
+
+async def query_offer_facets(params: OfferListQuery):
+    """Run the page and its facet counts as one $facet aggregation; returns a (headers, body) cache entry"""
+    sort_field, sort_direction = offer_sort(params)
+    state = decode_cursor(params.cursor, sort_field, sort_direction) if params.cursor else None
+    projection = offer_projection(params, sort_field)
+    
+    offset = 0
+    page_query = offer_filter(params, exclude=("q",))
+    if sort_field == RELEVANCE_SORT:
+        projection["score"] = {"$meta": "textScore"}
+        offset = state["o"] if state else 0
+        page = [
+            {"$match": page_query},
+            {"$sort": {"score": {"$meta": "textScore"}, "id": 1}},
+            {"$skip": offset},
+        ]
+    else:
+        if state:
+            after = keyset_after(state, sort_field, sort_direction)
+            page_query = {"$and": [page_query, after]} if page_query else after
+        page = [
+            {"$match": page_query},
+            {"$sort": {sort_field: sort_direction, "id": sort_direction}},
+        ]
+    page += [{"$limit": params.limit + 1}, {"$project": aggregation_projection(projection)}]
+    
+    def counts(field: str, limit: Optional[int] = None) -> list:
+        stages = [
+            {"$match": offer_filter(params, exclude=("q", field))},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+        ]
+        return stages + [{"$limit": limit}] if limit else stages
+    
+    facets = {
+        "page": page,
+        "category": counts("category"),
+        "destination": counts("destination", FACET_DESTINATION_LIMIT),
+        # Roughly equal-population buckets; each max is the next bucket's min
+        "price": [
+            {"$match": offer_filter(params, exclude=("q", "price"))},
+            {"$bucketAuto": {"groupBy": "$price", "buckets": PRICE_HISTOGRAM_BUCKETS}},
+        ],
+    }
+    if params.include_total:
+        facets["total"] = [{"$match": offer_filter(params, exclude=("q",))}, {"$count": "count"}]
+    
+    # $text has to be in the first stage, so the search runs once ahead of $facet
+    pipeline = [{"$match": {"$text": {"$search": params.q}}}] if params.q else []
+    pipeline.append({"$facet": facets})
+    result = (await db.travel_offers.aggregate(pipeline).to_list(length=1))[0]
     
-    offers = list(db.travel_offers.find(query).sort(sort_params))
-    return parse_json(offers)
+    offers = result["page"]
+    has_more = len(offers) > params.limit
+    offers = [add_image_variants(offer) for offer in offers[:params.limit]]
+    headers = next_page_headers(offers, has_more, sort_field, sort_direction, offset, params.limit)
+    if sort_field in OFFER_INTERNAL_FIELDS:
+        for offer in offers:
+            offer.pop(sort_field, None)
+    if params.include_total:
+        headers["X-Total-Count"] = str(result["total"][0]["count"] if result["total"] else 0)
+    
+    return headers, dumps({
+        "offers": offers,
+        "facets": {
+            "category": [{"value": b["_id"], "count": b["count"]} for b in result["category"]],
+            "destination": [{"value": b["_id"], "count": b["count"]} for b in result["destination"]],
+            "price": [{"min": b["_id"]["min"], "max": b["_id"]["max"], "count": b["count"]} for b in result["price"]],
+        },
+    })
 
 @app.get("/api/offers/{offer_id}")
-async def get_travel_offer(offer_id: str):
-    offer = db.travel_offers.find_one({"id": offer_id})
-    if offer is None:
-        raise HTTPException(status_code=404, detail="Travel offer not found")
-    return parse_json(offer)
+async def get_travel_offer(offer_id: str, if_none_match: Optional[str] = Header(None)):
+    async def load():
+        offer = await db.travel_offers.find_one({"id": offer_id}, {**NO_ID, **{name: 0 for name in OFFER_INTERNAL_FIELDS}})
+        if offer is None:
+            raise HTTPException(status_code=404, detail="Travel offer not found")
+        return {}, dumps(add_image_variants(offer))
+    
+    cache_key = catalog_cache.key("offer", id=offer_id)
+    response = await conditional_cached_response("travel_offers", cache_key, if_none_match, load)
+    # Counted for 304 revalidations too; missing offers raise before this
+    record_offer_view(offer_id)
+    return response
+
+async def load_public_categories():
+    stats = await category_stats.list()
+    return {}, dumps({
+        "categories": [category["name"] for category in stats],
+        "counts": {category["name"]: category["count"] for category in stats},
+    })
 
 @app.get("/api/categories")
-async def get_categories():
-    categories = db.travel_offers.distinct("category")
-    return {"categories": categories}
+async def get_categories(request: Request):
+    cache_key = catalog_cache.key("categories")
+    snapshot = await snapshot_response(request, cache_key, None)
+    if snapshot is not None:
+        return snapshot
+    return cached_response(await catalog_cache.get_or_load(cache_key, load_public_categories))
+
+@app.get("/api/events")
+async def catalog_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of offer.* / ad.* created, updated and
+    deleted events, so pages can patch their lists instead of refetching.
+    A "resync" event means events were lost (the client fell behind or
+    reconnected too late) and lists should be refetched.
+    """
+    subscription = events.subscribe(last_event_id)
+    if subscription is None:
+        detail = "Shutting down" if events.closing else "Too many event listeners"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+    
+    async def stream():
+        try:
+            # Clients reconnect after 3s (with Last-Event-ID) if the stream drops
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscription.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line; keeps proxies from timing out an idle stream
+                    yield b": keep-alive\n\n"
+                    continue
+                if frame is None:
+                    # The worker is stopping; the client reconnects (to another one)
+                    return
+                yield frame
+        finally:
+            events.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+# --- Catalog snapshots ---
+
+def offer_list_snapshot(params: OfferListQuery):
+    """Loader of a list page as conditional_cached_response would tag it"""
+    cache_key = catalog_cache.key("offers", **params.cache_params())
+    
+    async def load(version: int):
+        if params.facets:
+            headers, body = await query_offer_facets(params)
+        else:
+            headers, body = await query_travel_offers(params)
+        etag = make_etag(str(version), cache_key)
+        return {**headers, "ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}, body
+    
+    return cache_key, load
+
+async def categories_snapshot(version: int):
+    return await load_public_categories()
+
+def register_snapshots():
+    # GET /api/offers without parameters, and the home page's default request
+    for name, params in (
+        ("offers", OfferListQuery()),
+        ("offers-home", OfferListQuery(facets=True, sort_by="created_at", sort_order="desc")),
+    ):
+        cache_key, load = offer_list_snapshot(params)
+        snapshots.add(cache_key, name, load)
+    snapshots.add(catalog_cache.key("categories"), "categories", categories_snapshot)
+
+register_snapshots()
+
+async def snapshot_response(request: Request, cache_key: str, if_none_match: Optional[str]):
+    """Serve a read from its pre-compressed snapshot, or None to run it normally"""
+    snapshot = await snapshots.current(cache_key)
+    if snapshot is None:
+        return None
+    etag = snapshot.headers.get("ETag")
+    if etag and etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    encoding = accepted_encoding(request.headers.get("accept-encoding"), snapshot.files)
+    headers = {**snapshot.headers, "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    accel_prefix = request.headers.get("x-snapshot-accel")
+    if accel_prefix:
+        # nginx sends the file itself; see the internal /_snapshots/ location
+        headers["X-Accel-Redirect"] = accel_prefix + snapshot.files[encoding]
+        return Response(media_type="application/json", headers=headers)
+    return FileResponse(snapshots.path(snapshot.files[encoding]), media_type="application/json", headers=headers)
 
 # Admin Endpoints - Category Management
 
 @app.get("/api/admin/categories")
 async def get_all_categories(current_user: dict = Depends(get_current_user)):
-    categories = list(db.categories.find())
-    return parse_json(categories)
+    categories = await db.categories.find({}, NO_ID).to_list(length=None)
+    return MongoJSONResponse(categories)
 
 @app.post("/api/admin/categories")
 async def create_category(category: CategoryCreate, current_user: dict = Depends(get_current_user)):
     # Check if category already exists
-    existing = db.categories.find_one({"name": category.name})
+    existing = await db.categories.find_one({"name": category.name})
     if existing:
         raise HTTPException(status_code=400, detail="Category with this name already exists")
     
@@ -336,47 +1094,91 @@ async def create_category(category: CategoryCreate, current_user: dict = Depends
     category_dict = category_obj.dict()
     
     # Save to database
-    db.categories.insert_one(category_dict)
+    await db.categories.insert_one(category_dict)
     
     return category_obj
 
+# Bulk routes are registered before the /{id} routes so "bulk" isn't taken for an id
+@app.post("/api/admin/categories/bulk")
+async def bulk_create_categories(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Create many categories in one write; duplicate names are reported per item"""
+    result, _ = await bulk_insert(db.categories, request.items, CategoryCreate, Category, request.ordered)
+    return result.to_dict()
+
+@app.put("/api/admin/categories/bulk")
+async def bulk_update_categories(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Update many categories; each item carries its `id` plus the fields to change"""
+    result, _ = await bulk_update(
+        db.categories, request.items, CategoryUpdate, request.ordered, touch_updated_at=False
+    )
+    return result.to_dict()
+
+@app.delete("/api/admin/categories/bulk")
+async def bulk_delete_categories(request: BulkDeleteRequest, current_user: dict = Depends(get_current_user)):
+    """Delete many categories; ones still used by offers are refused"""
+    async def in_use(ids):
+        used = await db.travel_offers.distinct("category", {"category": {"$in": ids}})
+        return {category_id: "Category is being used by travel offers" for category_id in used}
+    
+    result, _ = await bulk_delete(db.categories, request.ids, request.ordered, blocked=in_use)
+    return result.to_dict()
+
+@app.get("/api/admin/categories/stats")
+async def get_category_stats(current_user: dict = Depends(get_current_user)):
+    """Offer count and price range of every category in use"""
+    return MongoJSONResponse(await category_stats.list())
+
+@app.post("/api/admin/categories/stats/rebuild")
+async def rebuild_category_stats(current_user: dict = Depends(get_current_user)):
+    """Recompute the category summary from the offers (repairs drift)"""
+    categories = await category_stats.rebuild()
+    await catalog_cache.invalidate_namespace("categories")
+    # Same catalog version, possibly different counts
+    await snapshots.build(force=True)
+    return {"categories": categories}
+
+@app.get("/api/admin/snapshots/stats")
+async def get_snapshot_stats(current_user: dict = Depends(get_current_user)):
+    """Version and file sizes of each catalog snapshot"""
+    return snapshots.stats()
+
 @app.put("/api/admin/categories/{category_id}")
 async def update_category(
     category_id: str,
     category_update: CategoryUpdate,
     current_user: dict = Depends(get_current_user)
 ):
-    existing = db.categories.find_one({"id": category_id})
+    existing = await db.categories.find_one({"id": category_id})
     if not existing:
         raise HTTPException(status_code=404, detail="Category not found")
     
     # Check if updating to a name that already exists
     if category_update.name:
-        name_exists = db.categories.find_one({"name": category_update.name, "id": {"$ne": category_id}})
+        name_exists = await db.categories.find_one({"name": category_update.name, "id": {"$ne": category_id}})
         if name_exists:
             raise HTTPException(status_code=400, detail="Category with this name already exists")
     
     update_data = {k: v for k, v in category_update.dict().items() if v is not None}
     
-    db.categories.update_one(
+    await db.categories.update_one(
         {"id": category_id},
         {"$set": update_data}
     )
     
-    updated_category = db.categories.find_one({"id": category_id})
-    return parse_json(updated_category)
+    updated_category = await db.categories.find_one({"id": category_id}, NO_ID)
+    return MongoJSONResponse(updated_category)
 
 @app.delete("/api/admin/categories/{category_id}")
 async def delete_category(category_id: str, current_user: dict = Depends(get_current_user)):
     # Check if category is being used by any offer
-    offers_using_category = db.travel_offers.find_one({"category": category_id})
+    offers_using_category = await db.travel_offers.find_one({"category": category_id})
     if offers_using_category:
         raise HTTPException(
             status_code=400, 
             detail="Cannot delete category that is being used by travel offers"
         )
     
-    result = db.categories.delete_one({"id": category_id})
+    result = await db.categories.delete_one({"id": category_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
@@ -386,14 +1188,32 @@ async def delete_category(category_id: str, current_user: dict = Depends(get_cur
 # Admin Endpoints - Authentication and Offers
 
 @app.post("/api/admin/login", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_throttle.check(client_ip, form_data.username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(int(retry_after))},
+        )
+    
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Login service is busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
     if not user:
+        login_throttle.record_failure(client_ip, form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_throttle.record_success(client_ip, form_data.username)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["username"]}, expires_delta=access_token_expires
@@ -402,79 +1222,265 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.post("/api/admin/offers")
 async def create_travel_offer(offer: TravelOfferCreate, current_user: dict = Depends(get_current_user)):
+    offer.images = await store_inline_images(offer.images)
     travel_offer = TravelOffer(**offer.dict())
     travel_offer_dict = travel_offer.dict()
     
     # Save to database
-    db.travel_offers.insert_one(travel_offer_dict)
+    await db.travel_offers.insert_one(travel_offer_dict)
+    await category_stats.apply(added=[travel_offer_dict])
+    await invalidate_offer_caches(travel_offer.id)
+    await publish_offer_events("created", [travel_offer_dict])
     
     return travel_offer
 
+async def prepare_offer_images(offer):
+    if offer.images is not None:
+        offer.images = await store_inline_images(offer.images)
+    return offer
+
+@app.post("/api/admin/offers/bulk")
+async def bulk_create_travel_offers(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Validate and insert many offers with one insert_many"""
+    result, created = await bulk_insert(
+        db.travel_offers, request.items, TravelOfferCreate, TravelOffer, request.ordered,
+        prepare=prepare_offer_images,
+    )
+    if created:
+        await category_stats.apply(added=created)
+        await invalidate_offer_caches(*(offer["id"] for offer in created))
+        await publish_offer_events("created", created)
+    return result.to_dict()
+
+@app.put("/api/admin/offers/bulk")
+async def bulk_update_travel_offers(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Update many offers with one bulk_write; each item carries its `id`"""
+    result, applied = await bulk_update(
+        db.travel_offers, request.items, TravelOfferUpdate, request.ordered,
+        prepare=prepare_offer_images,
+    )
+    if applied:
+        moved = [(before, {**before, **changes}) for before, changes in applied if summary_changed(before, changes)]
+        if moved:
+            await category_stats.apply(added=[after for _, after in moved], removed=[before for before, _ in moved])
+        await invalidate_offer_caches(
+            *(before["id"] for before, _ in applied),
+            categories_changed=any(
+                changes.get("category", before["category"]) != before["category"]
+                for before, changes in applied
+            ),
+        )
+        await publish_offer_events("updated", ({**before, **changes} for before, changes in applied))
+    return result.to_dict()
+
+@app.delete("/api/admin/offers/bulk")
+async def bulk_delete_travel_offers(request: BulkDeleteRequest, current_user: dict = Depends(get_current_user)):
+    """Delete many offers with one delete_many"""
+    result, deleted = await bulk_delete(db.travel_offers, request.ids, request.ordered)
+    if deleted:
+        await category_stats.apply(removed=deleted)
+        await invalidate_offer_caches(*(offer["id"] for offer in deleted))
+        await publish_offer_events("deleted", deleted)
+    return result.to_dict()
+
+@app.get("/api/admin/offers/export")
+async def export_travel_offers(
+    compress: bool = Query(False, alias="gzip"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream every offer as NDJSON (one document per line), optionally gzipped"""
+    filename = f"travel_offers-{datetime.utcnow():%Y%m%dT%H%M%SZ}.ndjson"
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        export_ndjson(export_cursor(db.travel_offers), compress=compress),
+        media_type="application/gzip" if compress else NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+@app.post("/api/admin/offers/import")
+async def import_travel_offers(
+    request: Request,
+    content_encoding: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Upsert offers on `id` from an NDJSON request body (Content-Encoding:
+    gzip is accepted), written in batches as the body streams in
+    """
+    gzipped = (content_encoding or "").lower() == "gzip" or request.headers.get("content-type", "").startswith("application/gzip")
+    result = await import_ndjson(
+        db.travel_offers, request.stream(), TravelOffer, gzipped=gzipped, prepare=prepare_offer_images,
+    )
+    if result.inserted or result.updated:
+        # Previous versions of the replaced offers aren't kept, so recount
+        await category_stats.rebuild()
+        await invalidate_offer_caches()
+        await catalog_cache.invalidate_namespace("offer")
+        await events.publish(RESYNC, {"reason": "offers imported", "count": result.inserted + result.updated})
+    return result.to_dict()
+
 @app.put("/api/admin/offers/{offer_id}")
 async def update_travel_offer(
     offer_id: str, 
     offer_update: TravelOfferUpdate, 
     current_user: dict = Depends(get_current_user)
 ):
-    existing_offer = db.travel_offers.find_one({"id": offer_id})
+    existing_offer = await db.travel_offers.find_one({"id": offer_id})
     if existing_offer is None:
         raise HTTPException(status_code=404, detail="Travel offer not found")
     
+    if offer_update.images is not None:
+        offer_update.images = await store_inline_images(offer_update.images)
+    
     # Update fields that are provided
     update_data = {k: v for k, v in offer_update.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
-    db.travel_offers.update_one(
+    await db.travel_offers.update_one(
         {"id": offer_id},
         {"$set": update_data}
     )
+    updated_offer = await db.travel_offers.find_one({"id": offer_id}, NO_ID)
+    if summary_changed(existing_offer, update_data):
+        await category_stats.apply(added=[updated_offer], removed=[existing_offer])
+    await invalidate_offer_caches(
+        offer_id,
+        categories_changed=update_data.get("category", existing_offer["category"]) != existing_offer["category"],
+    )
+    await publish_offer_events("updated", [updated_offer])
     
-    updated_offer = db.travel_offers.find_one({"id": offer_id})
-    return parse_json(updated_offer)
+    return MongoJSONResponse(updated_offer)
 
 @app.delete("/api/admin/offers/{offer_id}")
 async def delete_travel_offer(offer_id: str, current_user: dict = Depends(get_current_user)):
-    result = db.travel_offers.delete_one({"id": offer_id})
+    deleted_offer = await db.travel_offers.find_one_and_delete({"id": offer_id}, projection=NO_ID)
     
-    if result.deleted_count == 0:
+    if deleted_offer is None:
         raise HTTPException(status_code=404, detail="Travel offer not found")
+    await category_stats.apply(removed=[deleted_offer])
+    await invalidate_offer_caches(offer_id)
+    await publish_offer_events("deleted", [deleted_offer])
     
     return {"message": "Travel offer deleted successfully"}
 
 # Advertisement Management Endpoints
 @app.get("/api/advertisements")
-async def get_advertisements(location: Optional[str] = None, active_only: bool = True):
-    """Get advertisements, optionally filtered by location and active status"""
-    query = {}
+async def get_advertisements(
+    location: Optional[str] = None,
+    active_only: bool = True,
+    pick: Optional[int] = Query(None, ge=1, le=AD_PICK_MAX),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Get advertisements, optionally filtered by location and active status.
+
+    With `location` and `pick=N`, serve a slot instead: up to N live ads
+    (active, inside their schedule) drawn by weight from the in-process ad
+    index, without touching the database.
+    """
+    if pick is not None:
+        if not location:
+            raise HTTPException(status_code=400, detail="pick requires a location")
+        ads = await ad_index.pick(location, pick)
+        return MongoJSONResponse(ads, headers={"Cache-Control": "no-store"})
     
-    if location:
-        query["placement.location"] = location
+    async def load():
+        query = {}
         
-    if active_only:
-        query["is_active"] = True
-        
-    ads = list(db.advertisements.find(query))
-    return parse_json(ads)
+        if location:
+            query["placement.location"] = location
+            
+        if active_only:
+            query["is_active"] = True
+            
+        ads = await db.advertisements.find(query, NO_ID).to_list(length=None)
+        return {}, dumps(ads)
+    
+    cache_key = catalog_cache.key("ads", location=location, active_only=active_only)
+    return await conditional_cached_response("advertisements", cache_key, if_none_match, load)
+
+@app.post("/api/advertisements/{ad_id}/impression", status_code=status.HTTP_204_NO_CONTENT)
+async def record_ad_impression(ad_id: str):
+    """Beacon: the ad was shown. Counted in memory and flushed in batches."""
+    return record_ad_event(ad_id, "impressions")
+
+@app.post("/api/advertisements/{ad_id}/click", status_code=status.HTTP_204_NO_CONTENT)
+async def record_ad_click(ad_id: str):
+    """Beacon: the ad was clicked"""
+    return record_ad_event(ad_id, "clicks")
+
+def record_ad_event(ad_id: str, field: str) -> Response:
+    # Checked against the in-process ad index, so a beacon never reads the database
+    if ad_id not in ad_index:
+        raise HTTPException(status_code=404, detail="Advertisement not found")
+    ad_counters.add({"ad_id": ad_id, "day": datetime.utcnow().strftime("%Y-%m-%d")}, {field: 1})
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.get("/api/advertisements/{ad_id}")
 async def get_advertisement(ad_id: str):
     """Get a specific advertisement by ID"""
-    ad = db.advertisements.find_one({"id": ad_id})
+    ad = await db.advertisements.find_one({"id": ad_id}, NO_ID)
     if ad is None:
         raise HTTPException(status_code=404, detail="Advertisement not found")
-    return parse_json(ad)
+    return MongoJSONResponse(ad)
 
 @app.post("/api/admin/advertisements")
 async def create_advertisement(ad: AdvertisementCreate, current_user: dict = Depends(get_current_user)):
     """Create a new advertisement (admin only)"""
+    ad.image_url = await store_inline_image(ad.image_url)
     advertisement = Advertisement(**ad.dict())
     advertisement_dict = advertisement.dict()
     
     # Save to database
-    db.advertisements.insert_one(advertisement_dict)
+    await db.advertisements.insert_one(advertisement_dict)
+    await invalidate_ad_caches(advertisement.placement.location)
+    await publish_ad_events("created", [advertisement_dict])
     
     return advertisement
 
+async def prepare_ad_image(ad):
+    if ad.image_url is not None:
+        ad.image_url = await store_inline_image(ad.image_url)
+    return ad
+
+@app.post("/api/admin/advertisements/bulk")
+async def bulk_create_advertisements(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Create many advertisements in one write (admin only)"""
+    result, created = await bulk_insert(
+        db.advertisements, request.items, AdvertisementCreate, Advertisement, request.ordered,
+        prepare=prepare_ad_image,
+    )
+    if created:
+        await invalidate_ad_caches(*{ad["placement"]["location"] for ad in created})
+        await publish_ad_events("created", created)
+    return result.to_dict()
+
+@app.put("/api/admin/advertisements/bulk")
+async def bulk_update_advertisements(request: BulkRequest, current_user: dict = Depends(get_current_user)):
+    """Update many advertisements in one write; each item carries its `id` (admin only)"""
+    result, applied = await bulk_update(
+        db.advertisements, request.items, AdvertisementUpdate, request.ordered,
+        prepare=prepare_ad_image,
+    )
+    if applied:
+        locations = set()
+        for before, changes in applied:
+            locations.add(before["placement"]["location"])
+            locations.add(changes.get("placement", before["placement"])["location"])
+        await invalidate_ad_caches(*locations)
+        await publish_ad_events("updated", ({**before, **changes} for before, changes in applied))
+    return result.to_dict()
+
+@app.delete("/api/admin/advertisements/bulk")
+async def bulk_delete_advertisements(request: BulkDeleteRequest, current_user: dict = Depends(get_current_user)):
+    """Delete many advertisements in one write (admin only)"""
+    result, deleted = await bulk_delete(db.advertisements, request.ids, request.ordered)
+    if deleted:
+        await invalidate_ad_caches(*{ad["placement"]["location"] for ad in deleted})
+        await publish_ad_events("deleted", deleted)
+    return result.to_dict()
+
 @app.put("/api/admin/advertisements/{ad_id}")
 async def update_advertisement(
     ad_id: str, 
@@ -482,51 +1488,70 @@ async def update_advertisement(
     current_user: dict = Depends(get_current_user)
 ):
     """Update an existing advertisement (admin only)"""
-    existing_ad = db.advertisements.find_one({"id": ad_id})
+    existing_ad = await db.advertisements.find_one({"id": ad_id})
     if existing_ad is None:
         raise HTTPException(status_code=404, detail="Advertisement not found")
     
+    if ad_update.image_url is not None:
+        ad_update.image_url = await store_inline_image(ad_update.image_url)
+    
     # Update fields that are provided
     update_data = {k: v for k, v in ad_update.dict(exclude_unset=True).items() if v is not None}
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
-    db.advertisements.update_one(
+    await db.advertisements.update_one(
         {"id": ad_id},
         {"$set": update_data}
     )
+    await invalidate_ad_caches(
+        existing_ad["placement"]["location"],
+        update_data.get("placement", existing_ad["placement"])["location"],
+    )
     
-    updated_ad = db.advertisements.find_one({"id": ad_id})
-    return parse_json(updated_ad)
+    updated_ad = await db.advertisements.find_one({"id": ad_id}, NO_ID)
+    await publish_ad_events("updated", [updated_ad])
+    return MongoJSONResponse(updated_ad)
 
 @app.delete("/api/admin/advertisements/{ad_id}")
 async def delete_advertisement(ad_id: str, current_user: dict = Depends(get_current_user)):
     """Delete an advertisement (admin only)"""
-    result = db.advertisements.delete_one({"id": ad_id})
+    existing_ad = await db.advertisements.find_one_and_delete({"id": ad_id})
     
-    if result.deleted_count == 0:
+    if existing_ad is None:
         raise HTTPException(status_code=404, detail="Advertisement not found")
+    await invalidate_ad_caches(existing_ad["placement"]["location"])
+    await publish_ad_events("deleted", [existing_ad])
     
     return {"message": "Advertisement deleted successfully"}
 
 @app.post("/api/admin/upload")
 async def upload_image(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    contents = await file.read()
-    # For simplicity, we're encoding the image as base64 and returning it
-    # In a production environment, you would store this in a file system or cloud storage
-    encoded_string = base64.b64encode(contents).decode("utf-8")
-    image_url = f"data:{file.content_type};base64,{encoded_string}"
+    """Store an image in the content-addressed media store and return its URL"""
+    # Read one byte past the limit so oversized uploads are caught without buffering them
+    contents = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(contents) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {MAX_UPLOAD_BYTES} bytes")
     
-    return {"image_url": image_url}
+    try:
+        # Hashing and disk writes happen off the event loop
+        image_url = await run_in_threadpool(image_store.save, contents, file.content_type)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Resized variants are rendered in the background; their URLs are known up front
+    image_variants.submit(image_store.path_for_url(image_url))
+    
+    return {"image_url": image_url, "variants": image_store.variant_urls(image_url)}
 
 @app.post("/api/admin/create-default-admin")
 async def create_default_admin():
     # Check if admin exists
-    admin_exists = db.admin_users.find_one({"username": "admin"})
+    admin_exists = await db.admin_users.find_one({"username": "admin"})
     if admin_exists:
         return {"message": "Default admin already exists"}
     
     # Create default admin user
-    hashed_password = get_password_hash("admin123")
+    hashed_password = await get_password_hash("admin123")
     admin_user = {
         "id": str(uuid.uuid4()),
         "username": "admin",
@@ -534,35 +1559,126 @@ async def create_default_admin():
         "created_at": datetime.utcnow()
     }
     
-    db.admin_users.insert_one(admin_user)
+    await db.admin_users.insert_one(admin_user)
+    await catalog_versions.bump("admin_users")
+    principal_cache.revoke(admin_user["username"])
     return {"message": "Default admin created successfully"}
 
+@app.get("/api/admin/login/stats")
+async def get_login_stats(current_user: dict = Depends(get_current_user)):
+    """Password hashing queue depth and throttled login count for this worker"""
+    return {**password_hasher.stats(), "throttled": login_throttle.rejected}
+
+# Cache observability
+@app.get("/api/admin/cache/stats")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters of the catalog cache for this worker"""
+    return catalog_cache.stats()
+
+@app.get("/api/admin/advertisements/stats")
+async def get_advertisement_stats(
+    ad_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=AD_STATS_MAX_DAYS),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Impressions and clicks per ad per day over the last `days` days (UTC),
+    newest first. Counts still buffered in a worker appear after its next flush.
+    """
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    query = {"day": {"$gte": since}}
+    if ad_id:
+        query["ad_id"] = ad_id
+    stats = await db.ad_stats.find(query, {"_id": 0}).sort([("day", -1), ("ad_id", 1)]).to_list(length=None)
+    for row in stats:
+        row.setdefault("impressions", 0)
+        row.setdefault("clicks", 0)
+        row["ctr"] = row["clicks"] / row["impressions"] if row["impressions"] else None
+    return MongoJSONResponse(stats)
+
+@app.get("/api/admin/events/stats")
+async def get_event_stats(current_user: dict = Depends(get_current_user)):
+    """Connected event clients and publish counts of this worker"""
+    return events.stats()
+
+@app.get("/api/admin/ad-index/stats")
+async def get_ad_index_stats(current_user: dict = Depends(get_current_user)):
+    """Version and per-slot sizes of this worker's ad index"""
+    return {**ad_index.stats(), "counters": ad_counters.stats()}
+
 # --- Startup and shutdown events ---
 
-@app.on_event("startup")
-async def startup_db_client():
-    # Create collections if they don't exist
-    db.create_collection("admin_users", check_exists=False)
-    db.create_collection("travel_offers", check_exists=False)
-    db.create_collection("categories", check_exists=False)
-    db.create_collection("advertisements", check_exists=False)
-    
-    # Create indexes
-    db.travel_offers.create_index("id", unique=True)
-    db.travel_offers.create_index("destination")
-    db.travel_offers.create_index("category")
-    db.travel_offers.create_index("price")
-    
-    db.admin_users.create_index("username", unique=True)
-    db.categories.create_index("id", unique=True)
-    db.categories.create_index("name", unique=True)
-    
-    db.advertisements.create_index("id", unique=True)
-    db.advertisements.create_index("placement.location")
-    db.advertisements.create_index("is_active")
+async def finish_startup():
+    """Bring the schema up to date (one worker migrates, the others wait), then report ready"""
+    applied = await migrator.wait_until_current()
+    if applied:
+        logger.info("Applied %d migrations; schema at version %d", applied, migrator.version)
+    # Like the migrations, retried until they succeed; the worker stays unready meanwhile
+    while True:
+        try:
+            await ad_index.start()
+            snapshots.schedule()
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Startup failed, retrying: %s", e)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+    app.state.ready = True
+    
+    if EXPLAIN_CHECK_ON_STARTUP:
+        # Log canonical queries that miss their indexes
+        asyncio.create_task(check_query_plans(db.travel_offers))
     
     logger.info("Connected to MongoDB")
 
+def close_event_streams_on_exit():
+    """
+    Chain onto the server's SIGTERM / SIGINT handlers so open event streams
+    end as soon as shutdown starts. Uvicorn waits for every open response
+    before it runs the shutdown handlers; without this it would wait out
+    the whole graceful timeout and be killed before the counters are flushed.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be set from the main thread (not so under a test client)
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        
+        def handle_exit(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(events.close_streams)
+            previous(signum, frame)
+        
+        signal.signal(sig, handle_exit)
+
+@app.on_event("startup")
+async def startup_db_client():
+    image_store.ensure_root()
+    snapshots.ensure_root()
+    await catalog_cache.start()
+    await events.start()
+    ad_counters.start()
+    offer_views.start()
+    close_event_streams_on_exit()
+    # Migrations and index builds run in the background: the worker serves
+    # requests meanwhile and /api/health/ready turns green when they finish
+    app.state.startup = asyncio.create_task(finish_startup())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.ready = False
+    app.state.startup.cancel()
+    await ad_index.close()
+    # Write buffered impressions / clicks before the connection goes away
+    await ad_counters.close()
+    await offer_views.close()
+    await snapshots.close()
+    await events.close()
+    image_variants.shutdown()
+    password_hasher.shutdown()
+    await catalog_cache.close()
     client.close()
+    mark_worker_exited()
@@ -0,0 +1,215 @@
+"""
+Pre-compressed snapshots of the hottest catalog reads.
+
+A few public reads (the unfiltered offer list, the home page's default
+list, the category list) return identical bytes between admin writes.
+After each write the handlers call SnapshotStore.schedule(), which
+(debounced) runs those queries once and writes each body to disk as
+identity, gzip and brotli files, plus a manifest holding the response
+headers and the catalog version the body was built at:
+
+    <name>.manifest.json
+    <name>.<digest>.json[.gz|.br]
+
+Body files are content-addressed and the manifest is replaced last with
+os.replace, so a reader always sees one complete generation. Files of the
+previous generation are kept for requests already on their way to nginx.
+
+A request is answered from a snapshot only while the manifest's version
+is the current one. Behind nginx the API replies with X-Accel-Redirect
+and nginx sends the file (sendfile); run directly, the API returns it as
+a FileResponse. Either way nothing is queried or serialized.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli files are optional; gzip and identity always exist
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Preferred first when a client accepts several
+ENCODINGS = ("br", "gzip")
+_SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+
+# (headers, body) of a snapshot, built at the given version
+SnapshotLoader = Callable[[int], Awaitable[Tuple[Dict[str, str], bytes]]]
+
+@dataclass
+class Snapshot:
+    name: str
+    version: int
+    headers: Dict[str, str]
+    # encoding -> file name in the snapshot directory
+    files: Dict[str, str]
+
+def _compress(body: bytes) -> Dict[str, bytes]:
+    encoded = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+    # Tiny bodies (an empty catalog) don't shrink; serve those as they are
+    return {"identity": body, **{encoding: data for encoding, data in encoded.items() if len(data) < len(body)}}
+
+def _write_atomic(path: Path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def accepted_encoding(accept_encoding: Optional[str], available) -> str:
+    """The best of `available` the client accepts (q=0 excludes)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+class SnapshotStore:
+    def __init__(self, root, versions: Callable[[], Awaitable[int]], debounce: float = 0.5, enabled: bool = True):
+        self.root = Path(root)
+        # Current catalog version; snapshots built at an older one are ignored
+        self.versions = versions
+        self.debounce = debounce
+        self.enabled = enabled
+        self.builds = 0
+        self.failed_builds = 0
+        self._loaders: Dict[str, Tuple[str, SnapshotLoader]] = {}
+        # name -> (manifest mtime, snapshot), re-read when the file changes
+        self._manifests: Dict[str, Tuple[int, Optional[Snapshot]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def add(self, key: str, name: str, load: SnapshotLoader):
+        """Snapshot the read identified by cache key `key` under file name `name`"""
+        self._loaders[key] = (name, load)
+
+    def ensure_root(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, filename: str) -> Path:
+        return self.root / filename
+
+    def _manifest_path(self, name: str) -> Path:
+        return self.root / f"{name}.manifest.json"
+
+    def _read_manifest(self, name: str) -> Optional[Snapshot]:
+        path = self._manifest_path(name)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._manifests.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            snapshot = Snapshot(**json.loads(path.read_bytes()))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Ignoring unreadable snapshot manifest %s: %s", path.name, e)
+            snapshot = None
+        self._manifests[name] = (mtime, snapshot)
+        return snapshot
+
+    async def current(self, key: str) -> Optional[Snapshot]:
+        """The snapshot of a cache key, if there is one for the current version"""
+        if not self.enabled or key not in self._loaders:
+            return None
+        name, _ = self._loaders[key]
+        snapshot = self._read_manifest(name)
+        version = await self.versions()
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        if snapshot is None or snapshot.version < version:
+            # Written offline (manage.py) or by a worker that died mid-build
+            self.schedule()
+        return None
+
+    def _write(self, name: str, version: int, headers: Dict[str, str], body: bytes):
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        files = {}
+        for encoding, data in _compress(body).items():
+            filename = f"{name}.{digest}.json{_SUFFIXES[encoding]}"
+            if not self.path(filename).exists():
+                _write_atomic(self.path(filename), data)
+            files[encoding] = filename
+        previous = self._read_manifest(name)
+        manifest = {"name": name, "version": version, "headers": headers, "files": files}
+        _write_atomic(self._manifest_path(name), json.dumps(manifest).encode("utf-8"))
+        keep = set(files.values()) | (set(previous.files.values()) if previous else set())
+        for path in self.root.glob(f"{name}.*.json*"):
+            if path.name not in keep and path != self._manifest_path(name):
+                path.unlink(missing_ok=True)
+
+    async def build(self, force: bool = False) -> int:
+        """Rewrite snapshots older than the current version (all with force); returns how many"""
+        if not self.enabled:
+            return 0
+        # Read before the queries run, so a snapshot can only be labelled older than it is
+        version = await self.versions()
+        written = 0
+        for name, load in self._loaders.values():
+            snapshot = self._read_manifest(name)
+            if not force and snapshot is not None and snapshot.version >= version:
+                continue
+            headers, body = await load(version)
+            await asyncio.to_thread(self._write, name, version, headers, body)
+            written += 1
+        self.builds += 1
+        return written
+
+    async def _run(self):
+        while self._dirty:
+            self._dirty = False
+            await asyncio.sleep(self.debounce)
+            try:
+                await self.build()
+            except Exception as e:
+                self.failed_builds += 1
+                logger.warning("Could not rebuild catalog snapshots: %s", e)
+
+    def schedule(self):
+        """Rebuild stale snapshots soon; a burst of writes costs one rebuild"""
+        if not self.enabled:
+            return
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshots = {}
+        for name, _ in self._loaders.values():
+            snapshot = self._read_manifest(name)
+            snapshots[name] = None if snapshot is None else {
+                "version": snapshot.version,
+                "bytes": {
+                    encoding: self.path(filename).stat().st_size
+                    for encoding, filename in snapshot.files.items()
+                    if self.path(filename).exists()
+                },
+            }
+        return {"builds": self.builds, "failed_builds": self.failed_builds, "snapshots": snapshots}
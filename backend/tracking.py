@@ -0,0 +1,174 @@
+"""
+Buffered counters for high-volume events (ad impressions and clicks,
+offer views).
+
+Events are folded into an in-memory map of
+    (document key) -> {field: amount}
+and written as one unordered bulk_write of $inc updates (upserts by default) every
+`flush_interval` seconds, or sooner once `flush_threshold` events are
+pending. A burst of a thousand impressions on one ad costs one update.
+
+Fields named in `log_fields` hold log2 of a sum instead of the sum: their
+amounts are log2 values, folded with log2_add in memory and in Mongo
+(an update pipeline instead of $inc). 0 stands for "nothing counted yet".
+
+Counts still in memory are lost if the process dies without a clean
+shutdown; close() flushes them. A failed flush puts its counts back so
+the next flush retries them.
+"""
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Sorted (field, value) pairs identifying the counter document
+CounterKey = Tuple[Tuple[str, Any], ...]
+
+class CounterBuffer:
+    def __init__(
+        self,
+        collection,
+        flush_interval: float = 5,
+        flush_threshold: int = 1000,
+        upsert: bool = True,
+        on_flush: Optional[Callable[[], Awaitable[None]]] = None,
+        log_fields: Iterable[str] = (),
+    ):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        # False when counting into existing documents that must not be recreated
+        self.upsert = upsert
+        self.on_flush = on_flush
+        self.log_fields = frozenset(log_fields)
+        self.pending_events = 0
+        self.flushed_events = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._counts: Dict[CounterKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+    def add(self, key: Dict[str, Any], amounts: Dict[str, float]):
+        """Count one event against the document identified by `key`"""
+        self._fold(self._counts[tuple(sorted(key.items()))], amounts)
+        self.pending_events += 1
+        if self.pending_events >= self.flush_threshold and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Write pending counts; returns the number of documents updated"""
+        if not self._counts:
+            return 0
+        counts, self._counts = self._counts, defaultdict(lambda: defaultdict(float))
+        events, self.pending_events = self.pending_events, 0
+        ops = [UpdateOne(dict(key), self._update(fields), upsert=self.upsert) for key, fields in counts.items()]
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning("Could not flush %d counters to %s: %s", len(ops), self.collection.name, e)
+            self._restore(counts, events)
+            return 0
+        self.flushes += 1
+        self.flushed_events += events
+        if self.on_flush is not None:
+            await self.on_flush()
+        return len(ops)
+
+    def _fold(self, counters: Dict[str, float], amounts: Dict[str, float]):
+        for field, amount in amounts.items():
+            if field in self.log_fields and field in counters:
+                counters[field] = log2_add(counters[field], amount)
+            else:
+                counters[field] += amount
+
+    def _update(self, fields: Dict[str, float]):
+        if not self.log_fields.intersection(fields):
+            return {"$inc": {field: _whole(amount) for field, amount in fields.items()}}
+        values = {}
+        for field, amount in fields.items():
+            current = {"$ifNull": [f"${field}", 0]}
+            if field in self.log_fields:
+                values[field] = _log2_add_expression(current, amount)
+            else:
+                values[field] = {"$add": [current, _whole(amount)]}
+        return [{"$set": values}]
+
+    def _restore(self, counts: Dict[CounterKey, Dict[str, float]], events: int):
+        for key, fields in counts.items():
+            self._fold(self._counts[key], fields)
+        self.pending_events += events
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Counter flush to %s failed: %s", self.collection.name, e)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the periodic flush and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushing is not None:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_events": self.pending_events,
+            "pending_documents": len(self._counts),
+            "flushed_events": self.flushed_events,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+def _whole(amount: float):
+    """Keep integer counters integral in Mongo"""
+    return int(amount) if float(amount).is_integer() and abs(amount) < 2 ** 53 else amount
+
+def log2_add(a: float, b: float) -> float:
+    """log2(2^a + 2^b), without leaving log space"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2.0 ** (low - high))
+
+def _log2_add_expression(current, amount: float):
+    """log2_add as an aggregation expression; a current value of 0 means empty"""
+    return {
+        "$cond": [
+            {"$lte": [current, 0]},
+            amount,
+            {
+                "$add": [
+                    {"$max": [current, amount]},
+                    {"$log": [{"$add": [1, {"$pow": [2, {"$subtract": [{"$min": [current, amount]}, {"$max": [current, amount]}]}]}]}, 2]},
+                ]
+            },
+        ]
+    }
+
+def forward_decay_log_weight(when: datetime, epoch: datetime, half_life_seconds: float) -> float:
+    """
+    log2 of the weight of an event at `when` for an exponentially decayed score.
+
+    Rather than decaying every stored score as time passes, each new event
+    is weighted 2^((when - epoch) / half_life). Scores summed this way rank
+    exactly like the decayed ones (all are off by the same factor at any
+    moment), so they can be accumulated and indexed. The weights themselves
+    overflow a double after ~1000 half-lives (under three years with a one
+    day half-life), so scores are kept as log2 of the sum (see log_fields)
+    and only the exponent is computed here, which stays small.
+    """
+    return (when - epoch).total_seconds() / half_life_seconds
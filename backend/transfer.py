@@ -0,0 +1,181 @@
+"""
+NDJSON export and import of a collection, one document per line.
+
+Both directions are streamed: export encodes documents as the Mongo cursor
+yields them, and import parses the request body as it arrives and writes
+it in fixed-size upsert batches. The next chunk of the body isn't read
+until the previous batch has been written, so a fast uploader is held
+back by TCP flow control instead of filling memory.
+"""
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import orjson
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from bulk import validation_message
+from serialization import NO_ID, dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Documents per cursor batch on export / per bulk_write on import
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+# Encoded bytes gathered before a chunk is sent on export
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Longest line accepted on import; anything longer is a broken stream
+MAX_LINE_BYTES = 16 * 1024 * 1024
+# Per-line errors reported back; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+class ImportAborted(ValueError):
+    """The stream can't be parsed any further (bad gzip, oversized line)"""
+
+async def export_ndjson(cursor, compress: bool = False) -> AsyncIterator[bytes]:
+    """Encode a cursor's documents as NDJSON chunks, gzipped when asked"""
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer: List[bytes] = []
+    size = 0
+    async for doc in cursor:
+        line = dumps(doc) + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if gzip is not None:
+                chunk = gzip.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if gzip is not None:
+        chunk = gzip.compress(chunk) + gzip.flush()
+    if chunk:
+        yield chunk
+
+def export_cursor(collection, query: Optional[Dict[str, Any]] = None):
+    """Cursor over a whole collection in a stable order, without _id"""
+    return collection.find(query or {}, NO_ID).sort("id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+async def _lines(chunks: AsyncIterator[bytes], gzipped: bool) -> AsyncIterator[bytes]:
+    gunzip = zlib.decompressobj(47) if gzipped else None
+    # Pieces of the line not yet terminated by a newline
+    pending: List[bytes] = []
+    pending_size = 0
+    async for chunk in chunks:
+        if gunzip is not None:
+            try:
+                chunk = gunzip.decompress(chunk)
+            except zlib.error as e:
+                raise ImportAborted(f"Invalid gzip stream: {e}")
+        *lines, tail = chunk.split(b"\n")
+        if lines:
+            pending.append(lines[0])
+            lines[0] = b"".join(pending)
+            pending, pending_size = [], 0
+        pending.append(tail)
+        pending_size += len(tail)
+        if pending_size > MAX_LINE_BYTES:
+            raise ImportAborted(f"Line longer than {MAX_LINE_BYTES} bytes")
+        for line in lines:
+            yield line
+    if gunzip is not None and not gunzip.eof:
+        raise ImportAborted("Truncated gzip stream")
+    last = b"".join(pending)
+    if last:
+        yield last
+
+class ImportResult:
+    def __init__(self):
+        self.lines = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.aborted: Optional[str] = None
+
+    def fail(self, line: int, error: str, item_id: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "id": item_id, "error": error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "lines": self.lines,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "errors": self.errors,
+            "aborted": self.aborted,
+        }
+
+async def _write_batch(collection, batch: List[ReplaceOne], lines: List[Tuple[int, str]], result: ImportResult):
+    try:
+        outcome = await collection.bulk_write(batch, ordered=False)
+        details = outcome.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for write_error in details.get("writeErrors", []):
+            line, item_id = lines[write_error["index"]]
+            result.fail(line, write_error.get("errmsg", "Write failed"), item_id)
+    upserted = details.get("nUpserted", 0)
+    modified = details.get("nModified", 0)
+    result.inserted += upserted
+    result.updated += modified
+    result.unchanged += details.get("nMatched", 0) - modified
+
+async def import_ndjson(
+    collection,
+    chunks: AsyncIterator[bytes],
+    document_model: Type[BaseModel],
+    gzipped: bool = False,
+    prepare: Optional[Callable[[BaseModel], Awaitable[BaseModel]]] = None,
+) -> ImportResult:
+    """
+    Validate each line against `document_model` and upsert it on `id`,
+    IMPORT_BATCH_SIZE documents per bulk_write. Bad lines are reported
+    and skipped; a stream that can't be parsed further stops the import
+    after the batches already written.
+    """
+    result = ImportResult()
+    batch: List[ReplaceOne] = []
+    written: List[Tuple[int, str]] = []
+    try:
+        async for line in _lines(chunks, gzipped):
+            result.lines += 1
+            if not line.strip():
+                continue
+            item_id = None
+            try:
+                data = orjson.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("Line is not a JSON object")
+                item_id = data.get("id")
+                obj = document_model(**data)
+                if prepare is not None:
+                    obj = await prepare(obj)
+            except ValidationError as e:
+                result.fail(result.lines, validation_message(e), item_id)
+                continue
+            except HTTPException as e:
+                result.fail(result.lines, str(e.detail), item_id)
+                continue
+            except ValueError as e:
+                result.fail(result.lines, str(e), item_id)
+                continue
+            doc = obj.dict()
+            batch.append(ReplaceOne({"id": doc["id"]}, doc, upsert=True))
+            written.append((result.lines, doc["id"]))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await _write_batch(collection, batch, written, result)
+                batch, written = [], []
+    except ImportAborted as e:
+        result.aborted = str(e)
+    if batch:
+        await _write_batch(collection, batch, written, result)
+    return result
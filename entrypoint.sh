@@ -4,26 +4,80 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
-BACKEND_PID=$!
-
-echo "Waiting for backend to start..."
-sleep 30
+# Worker processes (defaults to one per CPU)
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-$(nproc)}
+# Seconds in-flight requests get to finish after SIGTERM. Docker kills the
+# container 10s after SIGTERM unless the stop timeout is raised (docker stop -t,
+# compose stop_grace_period); keep this a couple of seconds below that, so the
+# workers still flush buffered counters on their way out.
+GRACEFUL_TIMEOUT=${GRACEFUL_TIMEOUT:-8}
+# Seconds to wait for the backend to report ready before giving up
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+READY_URL="http://127.0.0.1:8001/api/health/ready"
+export WEB_CONCURRENCY
 
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
+if [ "$WEB_CONCURRENCY" -gt 1 ] && [ -z "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Workers share metric files so any of them can answer a scrape
+    PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus-multiproc
+fi
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Samples from a previous run must not leak into this one
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    export PROMETHEUS_MULTIPROC_DIR
 fi
 
+# Graceful drain: nginx finishes open requests (QUIT), uvicorn lets workers
+# complete in-flight requests for up to GRACEFUL_TIMEOUT seconds (TERM).
+# Installed before anything starts, so a stop during startup drains too;
+# a process not started yet has no PID to signal.
+BACKEND_PID=
+NGINX_PID=
+shutdown() {
+    echo "Shutting down..."
+    if [ -n "$NGINX_PID" ]; then
+        kill -QUIT "$NGINX_PID" 2>/dev/null || true
+    fi
+    if [ -n "$BACKEND_PID" ]; then
+        kill -TERM "$BACKEND_PID" 2>/dev/null || true
+    fi
+    if [ -n "$NGINX_PID" ]; then
+        wait "$NGINX_PID" 2>/dev/null || true
+    fi
+    if [ -n "$BACKEND_PID" ]; then
+        wait "$BACKEND_PID" 2>/dev/null || true
+    fi
+    exit 0
+}
+trap shutdown TERM INT
+
+echo "Starting FastAPI backend with $WEB_CONCURRENCY worker(s)"
+uvicorn server:app --host 0.0.0.0 --port 8001 \
+    --workers "$WEB_CONCURRENCY" \
+    --timeout-graceful-shutdown "$GRACEFUL_TIMEOUT" &
+BACKEND_PID=$!
+
+echo "Waiting for backend to become ready..."
+waited=0
+until wget -q -O /dev/null "$READY_URL" 2>/dev/null; do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if [ "$waited" -ge "$READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 1
+    waited=$((waited + 1))
+done
+echo "Backend ready after ${waited}s"
+
 # Start Nginx
 nginx -g 'daemon off;' &
 NGINX_PID=$!
 
-# Handle termination signals
-trap 'kill $BACKEND_PID $NGINX_PID; exit 0' SIGTERM SIGINT
-
 # Check if processes are still running
 while kill -0 $BACKEND_PID 2>/dev/null && kill -0 $NGINX_PID 2>/dev/null; do
     sleep 1
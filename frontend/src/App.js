@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { HashRouter, Routes, Route, useParams, Link, useNavigate } from "react-router-dom";
 import axios from "axios";
 import "./App.css";
@@ -6,6 +6,80 @@ import "./App.css";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Fire-and-forget ad beacon ("impression" or "click"); survives page navigation
+const trackAd = (ad, event) => {
+  if (!ad) return;
+  const url = `${API}/advertisements/${ad.id}/${event}`;
+  if (navigator.sendBeacon && navigator.sendBeacon(url)) return;
+  axios.post(url).catch(() => {});
+};
+
+// Live catalog changes over Server-Sent Events. `handlers` maps an event
+// type (offer.updated, ad.deleted, resync, ...) to a function of its data.
+const CATALOG_EVENT_TYPES = [
+  "offer.created", "offer.updated", "offer.deleted",
+  "ad.created", "ad.updated", "ad.deleted",
+  "resync",
+];
+const useCatalogEvents = (handlers) => {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    if (!window.EventSource) return undefined;
+    // Reconnects by itself, sending Last-Event-ID so missed events are replayed
+    const source = new EventSource(`${API}/events`);
+    CATALOG_EVENT_TYPES.forEach((type) => {
+      source.addEventListener(type, (event) => {
+        const handler = handlersRef.current[type];
+        if (handler) handler(JSON.parse(event.data));
+      });
+    });
+    return () => source.close();
+  }, []);
+};
+
+// GET /api/offers returns one page; the cursor for the next is in X-Next-Cursor
+const nextCursor = (response) => (
+  response.headers["x-has-more"] === "true" ? response.headers["x-next-cursor"] : null
+);
+
+// Query string of the Home filters (shared by the first page and "load more")
+const offerFilterQuery = (filters) => {
+  let url = "";
+  if (filters.destination) {
+    // Free-text box: use the ranked search instead of an exact destination match
+    url += `q=${encodeURIComponent(filters.destination)}&`;
+  }
+  if (filters.category) {
+    url += `category=${encodeURIComponent(filters.category)}&`;
+  }
+  if (filters.minPrice) {
+    url += `min_price=${filters.minPrice}&`;
+  }
+  if (filters.maxPrice) {
+    url += `max_price=${filters.maxPrice}&`;
+  }
+  if (filters.sortBy) {
+    url += `sort_by=${filters.sortBy}&sort_order=${filters.sortOrder}`;
+  }
+  return url;
+};
+
+// Every offer, following X-Next-Cursor page by page (admin list)
+const fetchAllOffers = async () => {
+  const offers = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(`${API}/offers`, {
+      params: { limit: 500, ...(cursor ? { cursor } : {}) },
+    });
+    offers.push(...response.data);
+    cursor = nextCursor(response);
+  } while (cursor);
+  return offers;
+};
+
 // Main Navigation Component
 const Navbar = () => {
   return (
@@ -61,7 +135,13 @@ const OfferCard = ({ offer }) => {
     >
       <div className="relative h-48 sm:h-64">
         <img
-          src={offer.images?.[0] || "https://images.unsplash.com/photo-1517760444937-f6397edcbbcd?q=80&w=2670&auto=format&fit=crop&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D"}
+          src={offer.image_variants?.card?.webp || offer.images?.[0] || "https://images.unsplash.com/photo-1517760444937-f6397edcbbcd?q=80&w=2670&auto=format&fit=crop&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D"}
+          onError={(e) => {
+            // Variants are rendered in the background; fall back to the original until they exist
+            if (offer.images?.[0] && e.currentTarget.src !== offer.images[0]) {
+              e.currentTarget.src = offer.images[0];
+            }
+          }}
           alt={offer.title}
           className="w-full h-full object-cover"
           data-testid="offer-image"
@@ -103,7 +183,7 @@ const OfferCard = ({ offer }) => {
 };
 
 // Filter Component
-const FilterBar = ({ onFilterChange }) => {
+const FilterBar = ({ onFilterChange, facets }) => {
   const [destination, setDestination] = useState("");
   const [category, setCategory] = useState("");
   const [minPrice, setMinPrice] = useState("");
@@ -181,11 +261,14 @@ const FilterBar = ({ onFilterChange }) => {
             className="w-full p-2 border border-gray-300 rounded-md focus:ring-teal-500 focus:border-teal-500"
           >
             <option value="">All Categories</option>
-            {categories.map((cat) => (
-              <option key={cat} value={cat}>
-                {cat}
-              </option>
-            ))}
+            {categories.map((cat) => {
+              const bucket = facets?.category?.find((b) => b.value === cat);
+              return (
+                <option key={cat} value={cat}>
+                  {facets ? `${cat} (${bucket ? bucket.count : 0})` : cat}
+                </option>
+              );
+            })}
           </select>
         </div>
 
@@ -221,6 +304,7 @@ const FilterBar = ({ onFilterChange }) => {
             className="w-full p-2 border border-gray-300 rounded-md focus:ring-teal-500 focus:border-teal-500"
           >
             <option value="created_at">Date Added</option>
+            <option value="popularity">Popularity</option>
             <option value="price">Price</option>
             <option value="travel_dates.start_date">Travel Date</option>
           </select>
@@ -285,8 +369,9 @@ const OfferDetail = () => {
     const fetchDetailAds = async () => {
       setAdLoading(true);
       try {
-        const response = await axios.get(`${API}/advertisements?location=offer_detail&active_only=true`);
+        const response = await axios.get(`${API}/advertisements?location=offer_detail&pick=1`);
         setDetailAds(response.data);
+        trackAd(response.data[0], "impression");
         setAdLoading(false);
       } catch (error) {
         console.error("Error fetching detail page ads:", error);
@@ -529,6 +614,7 @@ const OfferDetail = () => {
               </p>
               <a 
                 href={detailAds[0].link_url}
+                onClick={() => trackAd(detailAds[0], "click")}
                 target="_blank"
                 rel="noopener noreferrer"
                 className="mt-4 inline-block px-4 py-2 bg-teal-500 text-white rounded-md hover:bg-teal-600"
@@ -573,6 +659,7 @@ const OfferDetail = () => {
 // Home Page Component
 const Home = () => {
   const [offers, setOffers] = useState([]);
+  const [facets, setFacets] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filters, setFilters] = useState({
@@ -585,31 +672,32 @@ const Home = () => {
   });
   const [heroAds, setHeroAds] = useState([]);
   const [adLoading, setAdLoading] = useState(true);
+  // Bumped to refetch everything when live events were missed
+  const [reloadCount, setReloadCount] = useState(0);
+  const [cursor, setCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${API}/offers?cursor=${encodeURIComponent(cursor)}&${offerFilterQuery(filters)}`);
+      setOffers((current) => [...current, ...response.data.filter((o) => !current.some((c) => c.id === o.id))]);
+      setCursor(nextCursor(response));
+    } catch (error) {
+      console.error("Error fetching more offers:", error);
+    }
+    setLoadingMore(false);
+  };
 
   useEffect(() => {
     const fetchOffers = async () => {
       setLoading(true);
       try {
-        let url = `${API}/offers?`;
-        
-        if (filters.destination) {
-          url += `destination=${filters.destination}&`;
-        }
-        if (filters.category) {
-          url += `category=${filters.category}&`;
-        }
-        if (filters.minPrice) {
-          url += `min_price=${filters.minPrice}&`;
-        }
-        if (filters.maxPrice) {
-          url += `max_price=${filters.maxPrice}&`;
-        }
-        if (filters.sortBy) {
-          url += `sort_by=${filters.sortBy}&sort_order=${filters.sortOrder}`;
-        }
-        
-        const response = await axios.get(url);
-        setOffers(response.data);
+        // One request returns the first page and the filter panel's counts
+        const response = await axios.get(`${API}/offers?facets=true&${offerFilterQuery(filters)}`);
+        setOffers(response.data.offers);
+        setFacets(response.data.facets);
+        setCursor(nextCursor(response));
         setLoading(false);
       } catch (error) {
         console.error("Error fetching offers:", error);
@@ -621,8 +709,9 @@ const Home = () => {
     const fetchHeroAds = async () => {
       setAdLoading(true);
       try {
-        const response = await axios.get(`${API}/advertisements?location=hero&active_only=true`);
+        const response = await axios.get(`${API}/advertisements?location=hero&pick=1`);
         setHeroAds(response.data);
+        trackAd(response.data[0], "impression");
         setAdLoading(false);
       } catch (error) {
         console.error("Error fetching hero ads:", error);
@@ -632,7 +721,34 @@ const Home = () => {
 
     fetchOffers();
     fetchHeroAds();
-  }, [filters]);
+  }, [filters, reloadCount]);
+
+  // Patch the loaded lists in place as admins edit the catalog
+  const isDefaultView = !filters.destination && !filters.category && !filters.minPrice && !filters.maxPrice
+    && filters.sortBy === "created_at" && filters.sortOrder === "desc";
+  useCatalogEvents({
+    "offer.created": (offer) => {
+      // Only the unfiltered newest-first list is known to include it, at the top
+      if (isDefaultView) {
+        setOffers((current) => (current.some((o) => o.id === offer.id) ? current : [offer, ...current]));
+      }
+    },
+    "offer.updated": (offer) => {
+      setOffers((current) => current.map((o) => (o.id === offer.id ? { ...o, ...offer } : o)));
+    },
+    "offer.deleted": ({ id }) => {
+      setOffers((current) => current.filter((o) => o.id !== id));
+    },
+    "ad.updated": (ad) => {
+      setHeroAds((current) => current
+        .map((a) => (a.id === ad.id ? { ...a, ...ad } : a))
+        .filter((a) => a.is_active && a.placement.location === "hero"));
+    },
+    "ad.deleted": ({ id }) => {
+      setHeroAds((current) => current.filter((a) => a.id !== id));
+    },
+    resync: () => setReloadCount((count) => count + 1),
+  });
 
   const handleFilterChange = (newFilters) => {
     setFilters(newFilters);
@@ -681,6 +797,7 @@ const Home = () => {
               </div>
               <a 
                 href={heroAds[0].link_url} 
+                onClick={() => trackAd(heroAds[0], "click")}
                 target="_blank" 
                 rel="noopener noreferrer"
                 className="bg-white text-orange-500 hover:bg-gray-100 font-bold py-2 px-6 rounded-full"
@@ -707,7 +824,7 @@ const Home = () => {
         )}
 
         {/* Filters */}
-        <FilterBar onFilterChange={handleFilterChange} />
+        <FilterBar onFilterChange={handleFilterChange} facets={facets} />
 
         {/* Offers Grid */}
         {loading ? (
@@ -734,6 +851,18 @@ const Home = () => {
           </div>
         )}
 
+        {!loading && !error && cursor && (
+          <div className="mt-8 text-center">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-6 py-2 rounded-md text-white bg-teal-500 hover:bg-teal-600 disabled:bg-teal-300"
+            >
+              {loadingMore ? "Loading..." : "Load more offers"}
+            </button>
+          </div>
+        )}
+
         {/* Advertisement Section */}
         <div className="mt-12 p-6 bg-gradient-to-r from-blue-50 to-teal-50 rounded-lg shadow-sm">
           <div className="flex flex-col md:flex-row items-center justify-between">
@@ -906,8 +1035,7 @@ const AdminDashboard = () => {
 
     const fetchData = async () => {
       try {
-        const response = await axios.get(`${API}/offers`);
-        setOffers(response.data);
+        setOffers(await fetchAllOffers());
         setLoading(false);
       } catch (error) {
         console.error("Error fetching data:", error);
@@ -0,0 +1,78 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from ads import AliasTable, Slot
+
+NOW = datetime(2025, 6, 1, 12)
+
+def ad(ad_id, weight=1, starts_at=None, ends_at=None):
+    return {
+        "id": ad_id,
+        "weight": weight,
+        "starts_at": starts_at.isoformat() if starts_at else None,
+        "ends_at": ends_at.isoformat() if ends_at else None,
+    }
+
+@pytest.mark.parametrize("weights", [[1], [1, 1, 1, 1], [1, 2, 5], [0.1, 10, 3.5, 1]])
+def test_alias_table_probabilities_match_weights(weights):
+    table = AliasTable(weights)
+    n = len(weights)
+    # Each column is hit 1/n of the time and splits it between itself and its alias
+    exact = [0.0] * n
+    for i in range(n):
+        exact[i] += table.probability[i] / n
+        exact[table.alias[i]] += (1 - table.probability[i]) / n
+    total = sum(weights)
+    assert exact == pytest.approx([w / total for w in weights])
+
+def test_alias_table_sampling():
+    table = AliasTable([1, 3])
+    rng = random.Random(1)
+    counts = Counter(table.sample(rng) for _ in range(20000))
+    assert counts[1] / 20000 == pytest.approx(0.75, abs=0.02)
+
+def test_pick_distinct_ads():
+    slot = Slot([ad(str(i), weight=i + 1) for i in range(10)])
+    rng = random.Random(7)
+    for _ in range(200):
+        picked = slot.pick(3, NOW, rng)
+        assert len(picked) == 3
+        assert len({a["id"] for a in picked}) == 3
+
+def test_pick_prefers_heavier_ads():
+    slot = Slot([ad("light", 1), ad("heavy", 9), ad("other", 1), ad("more", 1)])
+    rng = random.Random(3)
+    counts = Counter(slot.pick(1, NOW, rng)[0]["id"] for _ in range(5000))
+    assert counts["heavy"] / 5000 == pytest.approx(0.75, abs=0.03)
+
+def test_pick_everything_when_count_covers_the_slot():
+    slot = Slot([ad("a"), ad("b"), ad("c")])
+    picked = slot.pick(5, NOW, random.Random(0))
+    assert sorted(a["id"] for a in picked) == ["a", "b", "c"]
+
+def test_pick_from_empty_slot():
+    assert Slot([]).pick(2, NOW, random.Random(0)) == []
+
+def test_ads_without_weight_count_as_one():
+    slot = Slot([ad("legacy", weight=None), ad("heavy", 3)])
+    rng = random.Random(5)
+    counts = Counter(slot.pick(1, NOW, rng)[0]["id"] for _ in range(4000))
+    assert counts["legacy"] / 4000 == pytest.approx(0.25, abs=0.03)
+
+def test_pick_follows_schedule():
+    hour = timedelta(hours=1)
+    slot = Slot([
+        ad("always"),
+        ad("later", starts_at=NOW + hour),
+        ad("ending", ends_at=NOW + hour),
+        ad("over", ends_at=NOW - hour),
+    ])
+    rng = random.Random(0)
+    ids = lambda when: sorted(a["id"] for a in slot.pick(10, when, rng))
+    assert ids(NOW) == ["always", "ending"]
+    assert slot.valid_until == NOW + hour
+    # The live set is rebuilt once the next boundary passes
+    assert ids(NOW + 2 * hour) == ["always", "later"]
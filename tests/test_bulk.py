@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from typing import Optional
+
+from pydantic import BaseModel, Field
+from pymongo.errors import BulkWriteError
+
+from bulk import BulkResult, _handle_write_errors, bulk_delete, bulk_insert, bulk_update
+
+def duplicate(index, name):
+    return {"index": index, "code": 11000, "keyValue": {"name": name}, "errmsg": "E11000 duplicate key"}
+
+class CategoryIn(BaseModel):
+    name: str
+
+class CategoryDoc(CategoryIn):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+
+class FakeCollection:
+    """insert_many that fails the given write positions like mongod would"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.inserted = []
+
+    async def insert_many(self, docs, ordered):
+        errors = []
+        for op_index, doc in enumerate(docs):
+            if op_index in self.failing:
+                errors.append(duplicate(op_index, doc["name"]))
+                if ordered:
+                    break
+            else:
+                self.inserted.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(self.inserted)})
+
+def test_unordered_write_errors_fail_only_their_items():
+    result = BulkResult(4, ordered=False)
+    error = BulkWriteError({"writeErrors": [duplicate(1, "b")]})
+    # Write position 1 is input item 2 (item 1 failed validation earlier)
+    failed = _handle_write_errors(result, error, positions=[0, 2, 3], ids=["a", "b", "c"])
+    assert failed == {1}
+    assert result.results[2]["status"] == "error"
+    assert result.results[2]["id"] == "b"
+    assert "Duplicate key" in result.results[2]["error"]
+    assert result.results[0] is None and result.results[3] is None
+
+def test_ordered_write_error_stops_the_rest():
+    result = BulkResult(4, ordered=True)
+    error = BulkWriteError({"writeErrors": [duplicate(1, "b")]})
+    failed = _handle_write_errors(result, error, positions=[0, 1, 2, 3], ids=["a", "b", "c", "d"])
+    assert failed == {1, 2, 3}
+    result.ok(0, "a", "created")
+    summary = result.to_dict()
+    assert [r["status"] for r in summary["results"]] == ["created", "error", "skipped", "skipped"]
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (1, 1, 2)
+
+def test_write_errors_without_details():
+    result = BulkResult(1, ordered=True)
+    assert _handle_write_errors(result, BulkWriteError({}), positions=[0], ids=["a"]) == set()
+    assert result.results == [None]
+
+def test_bulk_insert_unordered_reports_every_item():
+    items = [{"name": "a"}, {"name": None}, {"name": "c"}, {"name": "d"}]
+    collection = FakeCollection(failing={1})  # the third item's write
+    result, written = asyncio.run(bulk_insert(collection, items, CategoryIn, CategoryDoc, ordered=False))
+    summary = result.to_dict()
+    assert [r["status"] for r in summary["results"]] == ["created", "error", "error", "created"]
+    assert summary["results"][1]["id"] is None
+    # A write error still names the id the document would have had
+    assert summary["results"][2]["id"] is not None
+    assert [doc["name"] for doc in written] == ["a", "d"]
+    assert [r["id"] for r in summary["results"][::3]] == [doc["id"] for doc in written]
+
+def test_bulk_insert_ordered_skips_after_validation_error():
+    items = [{"name": "a"}, {}, {"name": "c"}]
+    collection = FakeCollection()
+    result, written = asyncio.run(bulk_insert(collection, items, CategoryIn, CategoryDoc, ordered=True))
+    summary = result.to_dict()
+    assert [r["status"] for r in summary["results"]] == ["created", "error", "skipped"]
+    assert [doc["name"] for doc in collection.inserted] == ["a"]
+    assert written == collection.inserted
+
+def test_bulk_insert_ordered_skips_after_write_error():
+    items = [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+    collection = FakeCollection(failing={0})
+    result, written = asyncio.run(bulk_insert(collection, items, CategoryIn, CategoryDoc, ordered=True))
+    assert [r["status"] for r in result.to_dict()["results"]] == ["error", "skipped", "skipped"]
+    assert written == []
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+class DocStore:
+    """find / bulk_write / delete_many over an in-memory list of documents"""
+
+    def __init__(self, docs):
+        self.docs = {doc["id"]: dict(doc) for doc in docs}
+        self.ops = []
+        self.deleted = []
+
+    def find(self, query, projection=None):
+        ids = query["id"]["$in"]
+        return Cursor([doc for doc_id, doc in self.docs.items() if doc_id in ids])
+
+    async def bulk_write(self, ops, ordered):
+        self.ops.extend(ops)
+
+    async def delete_many(self, query):
+        self.deleted.extend(query["id"]["$in"])
+
+class CategoryUpdate(BaseModel):
+    name: Optional[str] = None
+
+def test_bulk_update_rejects_repeated_ids():
+    collection = DocStore([{"id": "a", "name": "Beach"}, {"id": "b", "name": "Diving"}])
+    items = [{"id": "a", "name": "Luxury"}, {"id": "b", "name": "Family"}, {"id": "a", "name": "Budget"}]
+    result, applied = asyncio.run(bulk_update(collection, items, CategoryUpdate, ordered=False, touch_updated_at=False))
+    summary = result.to_dict()
+    assert [r["status"] for r in summary["results"]] == ["updated", "updated", "error"]
+    assert summary["results"][2]["error"] == "Duplicate id"
+    # One write and one (before, changes) pair per document
+    assert len(collection.ops) == 2
+    assert applied == [({"id": "a", "name": "Beach"}, {"name": "Luxury"}), ({"id": "b", "name": "Diving"}, {"name": "Family"})]
+
+def test_bulk_update_ordered_stops_at_repeated_id():
+    collection = DocStore([{"id": "a", "name": "Beach"}, {"id": "b", "name": "Diving"}])
+    items = [{"id": "a", "name": "Luxury"}, {"id": "a", "name": "Budget"}, {"id": "b", "name": "Family"}]
+    result, applied = asyncio.run(bulk_update(collection, items, CategoryUpdate, ordered=True, touch_updated_at=False))
+    assert [r["status"] for r in result.to_dict()["results"]] == ["updated", "error", "skipped"]
+    assert [before["id"] for before, _ in applied] == ["a"]
+
+def test_bulk_delete_rejects_repeated_ids():
+    collection = DocStore([{"id": "a"}, {"id": "b"}])
+    result, deleted = asyncio.run(bulk_delete(collection, ["a", "b", "a", "missing"], ordered=False))
+    assert [r["status"] for r in result.to_dict()["results"]] == ["deleted", "deleted", "error", "error"]
+    assert collection.deleted == ["a", "b"]
+    assert [doc["id"] for doc in deleted] == ["a", "b"]
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from cache import QueryCache
+
+def entry(body: bytes):
+    return {"Content-Type": "application/json"}, body
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_key_is_normalized():
+    cache = QueryCache()
+    assert cache.key("offers", b=2, a=1, c=None) == cache.key("offers", a="1", b="2")
+    assert cache.key("offers", a=1) != cache.key("ads", a=1)
+
+def test_caches_after_first_load():
+    cache = QueryCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return entry(b"[]")
+
+    async def scenario():
+        first = await cache.get_or_load("offers:", load)
+        second = await cache.get_or_load("offers:", load)
+        return first, second
+
+    assert run(scenario()) == (entry(b"[]"), entry(b"[]"))
+    assert len(calls) == 1
+    assert (cache.misses, cache.local_hits) == (1, 1)
+
+def test_concurrent_misses_coalesce():
+    cache = QueryCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return entry(b"[1]")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("offers:", load) for _ in range(10)))
+
+    assert run(scenario()) == [entry(b"[1]")] * 10
+    assert len(calls) == 1
+
+def test_load_errors_reach_every_waiter_and_are_not_cached():
+    cache = QueryCache()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(cache.get_or_load("offers:", failing) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        return await cache.get_or_load("offers:", lambda: asyncio.sleep(0, entry(b"ok")))
+
+    assert run(scenario()) == entry(b"ok")
+
+@pytest.mark.parametrize("invalidate", [
+    lambda cache: cache.invalidate_namespace("offers"),
+    lambda cache: cache.invalidate("offers:page=1"),
+])
+def test_invalidation_during_load_is_not_overwritten(invalidate):
+    """A load that started before an invalidation must not repopulate the cache"""
+    cache = QueryCache()
+
+    async def scenario():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def stale_load():
+            loading.set()
+            await release.wait()
+            return entry(b"stale")
+
+        task = asyncio.create_task(cache.get_or_load("offers:page=1", stale_load))
+        await loading.wait()
+        await invalidate(cache)
+        release.set()
+        # The waiting request still gets its answer...
+        assert await task == entry(b"stale")
+        # ...but the next one loads again
+        return await cache.get_or_load("offers:page=1", lambda: asyncio.sleep(0, entry(b"fresh")))
+
+    assert run(scenario()) == entry(b"fresh")
+
+def test_namespace_invalidation_leaves_other_namespaces():
+    cache = QueryCache()
+
+    async def scenario():
+        await cache.get_or_load("offers:", lambda: asyncio.sleep(0, entry(b"offers")))
+        await cache.get_or_load("categories:", lambda: asyncio.sleep(0, entry(b"categories")))
+        await cache.invalidate_namespace("offers")
+        offers = await cache.get_or_load("offers:", lambda: asyncio.sleep(0, entry(b"offers v2")))
+        categories = await cache.get_or_load("categories:", lambda: asyncio.sleep(0, entry(b"stale")))
+        return offers, categories
+
+    assert run(scenario()) == (entry(b"offers v2"), entry(b"categories"))
+
+def test_disabled_cache_always_loads():
+    cache = QueryCache(enabled=False)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return entry(b"[]")
+
+    async def scenario():
+        await cache.get_or_load("offers:", load)
+        await cache.get_or_load("offers:", load)
+
+    run(scenario())
+    assert len(calls) == 2
@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from server import RELEVANCE_SORT, decode_cursor, encode_cursor
+
+def test_round_trip():
+    cursor = encode_cursor("price", 1, {"v": 199.5, "id": "abc"})
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "price", 1) == {"s": "price", "d": 1, "v": 199.5, "id": "abc"}
+
+def test_round_trip_relevance_offset():
+    cursor = encode_cursor(RELEVANCE_SORT, -1, {"o": 48})
+    assert decode_cursor(cursor, RELEVANCE_SORT, -1)["o"] == 48
+
+@pytest.mark.parametrize("field, direction", [("created_at", 1), ("price", -1)])
+def test_rejects_other_sort_order(field, direction):
+    cursor = encode_cursor("price", 1, {"v": 10, "id": "abc"})
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, field, direction)
+    assert e.value.status_code == 400
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+@pytest.mark.parametrize("cursor, field, direction", [
+    ("not base64!", "price", 1),
+    (base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii"), "price", 1),
+    (raw_cursor([1, 2]), "price", 1),
+    (raw_cursor({"s": "price", "d": 1, "v": 10}), "price", 1),
+    (raw_cursor({"s": RELEVANCE_SORT, "d": -1, "o": -24}), RELEVANCE_SORT, -1),
+    (raw_cursor({"s": RELEVANCE_SORT, "d": -1, "o": "24"}), RELEVANCE_SORT, -1),
+])
+def test_rejects_malformed(cursor, field, direction):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, field, direction)
+    assert e.value.status_code == 400
@@ -0,0 +1,86 @@
+import asyncio
+import signal
+
+import pytest
+
+import server
+from events import EventBus
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr(server, "events", bus)
+    return bus
+
+async def open_stream():
+    response = await server.catalog_events(request=None, last_event_id=None)
+    return response.body_iterator
+
+def test_close_streams_wakes_waiting_client():
+    async def scenario():
+        bus = EventBus()
+        subscription = bus.subscribe()
+        waiting = asyncio.create_task(subscription.get())
+        await asyncio.sleep(0)
+        bus.close_streams()
+        return await asyncio.wait_for(waiting, timeout=1), await subscription.get()
+
+    assert run(scenario()) == (None, None)
+
+def test_close_streams_drops_pending_frames():
+    bus = EventBus(queue_size=2)
+    subscription = bus.subscribe()
+    run(bus.publish("offer.created", {"id": "a"}))
+    bus.close_streams()
+    run(bus.publish("offer.created", {"id": "b"}))
+    assert run(subscription.get()) is None
+
+def test_no_new_subscriptions_once_closing():
+    bus = EventBus()
+    bus.close_streams()
+    assert bus.subscribe() is None
+
+def test_open_stream_ends_on_shutdown(bus):
+    async def scenario():
+        stream = await open_stream()
+        frames = [await stream.__anext__()]
+        await bus.publish("offer.updated", {"id": "a"})
+        frames.append(await stream.__anext__())
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        await bus.close()
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(waiting, timeout=1)
+        return frames
+
+    frames = run(scenario())
+    assert frames[0] == b"retry: 3000\n\n"
+    assert b"offer.updated" in frames[1]
+    assert bus.stats()["clients"] == 0
+
+def test_exit_signal_ends_open_stream(bus):
+    received = []
+    previous_int = signal.getsignal(signal.SIGINT)
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+
+    async def scenario():
+        server.close_event_streams_on_exit()
+        stream = await open_stream()
+        await stream.__anext__()
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        signal.raise_signal(signal.SIGTERM)
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(waiting, timeout=1)
+
+    try:
+        run(scenario())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        signal.signal(signal.SIGINT, previous_int)
+    # The server's own handler still runs
+    assert received == [signal.SIGTERM]
+    assert bus.closing
@@ -0,0 +1,57 @@
+import pytest
+
+import security
+from security import LoginThrottle
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(security.time, "monotonic", clock)
+    return clock
+
+def test_limits_attempts_per_ip(clock):
+    throttle = LoginThrottle(max_per_ip=3, max_failures_per_user=10, window=60)
+    assert [throttle.check("1.1.1.1", f"user{i}") for i in range(3)] == [None, None, None]
+    assert throttle.check("1.1.1.1", "other") == 60
+    # Other addresses are unaffected
+    assert throttle.check("2.2.2.2", "other") is None
+    assert throttle.rejected == 1
+
+def test_limits_failures_per_username_and_ip(clock):
+    throttle = LoginThrottle(max_per_ip=100, max_failures_per_user=2, window=60)
+    for _ in range(2):
+        assert throttle.check("1.1.1.1", "admin") is None
+        throttle.record_failure("1.1.1.1", "admin")
+    assert throttle.check("1.1.1.1", "admin") is not None
+    # Someone else failing on purpose doesn't lock the account out for everyone
+    assert throttle.check("2.2.2.2", "admin") is None
+    assert throttle.check("1.1.1.1", "editor") is None
+
+def test_window_slides(clock):
+    throttle = LoginThrottle(max_per_ip=100, max_failures_per_user=1, window=60)
+    throttle.record_failure("1.1.1.1", "admin")
+    clock.now += 30
+    assert throttle.check("1.1.1.1", "admin") == 30
+    clock.now += 31
+    assert throttle.check("1.1.1.1", "admin") is None
+
+def test_success_clears_failures(clock):
+    throttle = LoginThrottle(max_per_ip=100, max_failures_per_user=1, window=60)
+    throttle.record_failure("1.1.1.1", "admin")
+    throttle.record_success("1.1.1.1", "admin")
+    assert throttle.check("1.1.1.1", "admin") is None
+
+def test_idle_keys_are_pruned(clock):
+    throttle = LoginThrottle(max_per_ip=5, max_failures_per_user=5, window=60, max_keys=2)
+    throttle.check("1.1.1.1", "a")
+    throttle.check("2.2.2.2", "b")
+    clock.now += 61
+    throttle.check("3.3.3.3", "c")
+    assert set(throttle._attempts) == {"3.3.3.3"}
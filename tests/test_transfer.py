@@ -0,0 +1,45 @@
+import asyncio
+import gzip
+
+import pytest
+
+import transfer
+from transfer import ImportAborted, _lines
+
+async def chunks_of(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def lines(data: bytes, size: int = 4, gzipped: bool = False):
+    async def collect():
+        return [line async for line in _lines(chunks_of(data, size), gzipped)]
+    return asyncio.run(collect())
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_splits_lines_across_chunks(size):
+    assert lines(b'{"a": 1}\n{"b": 2}\n\n{"c": 3}\n', size) == [b'{"a": 1}', b'{"b": 2}', b"", b'{"c": 3}']
+
+def test_last_line_without_newline():
+    assert lines(b"one\ntwo") == [b"one", b"two"]
+
+def test_empty_body():
+    assert lines(b"") == []
+
+@pytest.mark.parametrize("size", [5, 64])
+def test_gzip(size):
+    assert lines(gzip.compress(b"one\ntwo\nthree\n"), size, gzipped=True) == [b"one", b"two", b"three"]
+
+def test_truncated_gzip():
+    body = gzip.compress(b"one\ntwo\n" * 100)
+    with pytest.raises(ImportAborted, match="Truncated"):
+        lines(body[:-10], gzipped=True)
+
+def test_invalid_gzip():
+    with pytest.raises(ImportAborted, match="Invalid gzip"):
+        lines(b"not gzip at all", gzipped=True)
+
+def test_line_too_long(monkeypatch):
+    monkeypatch.setattr(transfer, "MAX_LINE_BYTES", 10)
+    assert lines(b"0123456789\nabc\n", 3) == [b"0123456789", b"abc"]
+    with pytest.raises(ImportAborted, match="Line longer"):
+        lines(b"0123456789abc\n", 3)